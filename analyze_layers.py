@@ -4,216 +4,286 @@
 Анализ распределения слоёв в SVG файле
 """
 
-import xml.etree.ElementTree as ET
 import sys
 import io
+import math
+import os
 import re
-from typing import Tuple, List
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from svg_common import NS_PATH, parse_length_mm
+
+# lxml (libxml2) разбирает большие SVG в разы быстрее стандартного ElementTree
+try:
+    from lxml import etree as ET
+    # Снимаем ограничение libxml2 на размер узла: атрибут 'd' бывает огромным
+    _ITERPARSE_OPTIONS = {'huge_tree': True}
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _ITERPARSE_OPTIONS = {}
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Заглушка декоратора: без numba функция остаётся обычной Python функцией"""
+        return lambda func: func
 
 # Fix console encoding for Windows
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+# Команды SVG path: M, L, H, V, C, S, Q, T, A, Z (и их lowercase версии)
+_COMMAND_SPLIT_RE = re.compile(r'([MLHVCSQTAZmlhvcsqtaz])')
+_NUMBER_RE = re.compile(r'[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?')
+_DIGIT_RE = re.compile(r'[0-9]')
 
-def parse_path_commands(d: str) -> List[Tuple[float, float]]:
+# Число параметров каждой команды и индекс конечной точки (x, y) среди них:
+# M/L/T x y, H x, V y, C x1 y1 x2 y2 x y, S/Q x1 y1 x y,
+# A rx ry rotation large-arc sweep x y, Z без параметров
+_COMMAND_PARAMS = {
+    command: params
+    for upper, params in {
+        'M': (2, 0), 'L': (2, 0), 'T': (2, 0), 'H': (1, 0), 'V': (1, 0),
+        'C': (6, 4), 'S': (4, 2), 'Q': (4, 2), 'A': (7, 5), 'Z': (0, 0),
+    }.items()
+    for command in (upper, upper.lower())
+}
+
+# С какого суммарного размера атрибутов 'd' bbox считается в пуле процессов
+PARALLEL_MIN_CHARS = 5_000_000
+
+
+def _tokenize(d: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    Извлекает все координаты из SVG path
+    Разбивает SVG path на массивы, пригодные для numba
 
     Args:
         d: атрибут 'd' элемента path
 
     Returns:
-        список координат (x, y)
+        (коды команд uint8, смещения аргументов каждой команды в nums, все числа float64)
     """
-    points = []
+    parts = _COMMAND_SPLIT_RE.split(d)
+    runs = [_NUMBER_RE.findall(args) for args in parts[2::2]]
 
-    # Удаляем лишние пробелы и заменяем запятые на пробелы
-    d = d.replace(',', ' ')
-    d = re.sub(r'\s+', ' ', d)
+    cmds = np.frombuffer(''.join(parts[1::2]).encode('ascii'), dtype=np.uint8)
+    offsets = np.zeros(len(runs) + 1, dtype=np.int64)
+    np.cumsum([len(run) for run in runs], out=offsets[1:])
+    nums = np.fromiter(map(float, chain.from_iterable(runs)), dtype=np.float64, count=int(offsets[-1]))
 
-    # Разбиваем на команды
-    # Команды: M, L, H, V, C, S, Q, T, A, Z (и их lowercase версии)
-    tokens = re.findall(r'[MLHVCSQTAZmlhvcsqtaz]|[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?', d)
+    return cmds, offsets, nums
 
-    i = 0
-    current_x, current_y = 0.0, 0.0
-    current_command = None
 
-    while i < len(tokens):
-        token = tokens[i]
+@njit(cache=True)
+def _run_state_machine(cmds: np.ndarray, offsets: np.ndarray, nums: np.ndarray) -> Tuple:
+    """
+    Проходит по командам path и сразу сводит конечные точки сегментов в bbox
 
-        # Проверяем, является ли токен командой
-        if token in 'MLHVCSQTAZmlhvcsqtaz':
-            current_command = token
-            i += 1
-            continue
+    Args:
+        cmds, offsets, nums: результат _tokenize
 
-        # Обрабатываем координаты в зависимости от команды
-        if current_command in ['M', 'm']:  # Move to
-            x = float(token)
-            y = float(tokens[i + 1]) if i + 1 < len(tokens) else 0
+    Returns:
+        (min_x, min_y, max_x, max_y); бесконечности, если точек нет
+    """
+    min_x, min_y = np.inf, np.inf
+    max_x, max_y = -np.inf, -np.inf
+    current_x, current_y = 0.0, 0.0
 
-            if current_command == 'M':  # Абсолютные координаты
-                current_x, current_y = x, y
-            else:  # Относительные координаты
-                current_x += x
-                current_y += y
+    for k in range(cmds.size):
+        # Строчная буква (бит 0x20) - относительные координаты
+        relative = (cmds[k] & 0x20) != 0
+        command = cmds[k] & 0xDF
+        start, end = offsets[k], offsets[k + 1]
 
-            points.append((current_x, current_y))
-            i += 2
+        if command == 72 or command == 86:  # H, V
+            for j in range(start, end):
+                if command == 72:
+                    current_x = current_x + nums[j] if relative else nums[j]
+                else:
+                    current_y = current_y + nums[j] if relative else nums[j]
+                min_x = current_x if current_x < min_x else min_x
+                max_x = current_x if current_x > max_x else max_x
+                min_y = current_y if current_y < min_y else min_y
+                max_y = current_y if current_y > max_y else max_y
+            continue
 
-        elif current_command in ['L', 'l']:  # Line to
-            x = float(token)
-            y = float(tokens[i + 1]) if i + 1 < len(tokens) else 0
+        # Число параметров команды и индекс конечной точки среди них
+        if command == 77 or command == 76 or command == 84:  # M, L, T
+            arity, endpoint = 2, 0
+        elif command == 67:  # C
+            arity, endpoint = 6, 4
+        elif command == 83 or command == 81:  # S, Q
+            arity, endpoint = 4, 2
+        elif command == 65:  # A
+            arity, endpoint = 7, 5
+        else:  # Z не изменяет координаты
+            continue
 
-            if current_command == 'L':
-                current_x, current_y = x, y
+        for j in range(start, end - arity + 1, arity):
+            if relative:
+                current_x += nums[j + endpoint]
+                current_y += nums[j + endpoint + 1]
             else:
-                current_x += x
-                current_y += y
+                current_x = nums[j + endpoint]
+                current_y = nums[j + endpoint + 1]
+            min_x = current_x if current_x < min_x else min_x
+            max_x = current_x if current_x > max_x else max_x
+            min_y = current_y if current_y < min_y else min_y
+            max_y = current_y if current_y > max_y else max_y
 
-            points.append((current_x, current_y))
-            i += 2
+    return min_x, min_y, max_x, max_y
 
-        elif current_command in ['H', 'h']:  # Horizontal line
-            x = float(token)
 
-            if current_command == 'H':
-                current_x = x
-            else:
-                current_x += x
+def _bbox_scan(d: str) -> Tuple[float, float, float, float]:
+    """
+    Вычисляет границы конечных точек всех сегментов SVG path
 
-            points.append((current_x, current_y))
-            i += 1
+    Список точек не строится: четыре экстремума обновляются прямо
+    в цикле разбора.
 
-        elif current_command in ['V', 'v']:  # Vertical line
-            y = float(token)
+    Args:
+        d: атрибут 'd' элемента path
 
-            if current_command == 'V':
-                current_y = y
-            else:
-                current_y += y
+    Returns:
+        (min_x, min_y, max_x, max_y); бесконечности, если точек нет
+    """
+    if NUMBA_AVAILABLE:
+        return _run_state_machine(*_tokenize(d))
 
-            points.append((current_x, current_y))
-            i += 1
+    min_x = min_y = math.inf
+    max_x = max_y = -math.inf
 
-        elif current_command in ['C', 'c']:  # Cubic Bezier
-            # C имеет 6 параметров: x1 y1 x2 y2 x y
-            params = [float(tokens[i + j]) for j in range(6) if i + j < len(tokens)]
+    # Разбиваем на пары (команда, аргументы); числа каждой команды
+    # переводятся в float одним вызовом, а не по одному токену
+    parts = _COMMAND_SPLIT_RE.split(d)
 
-            if len(params) >= 6:
-                if current_command == 'C':
-                    current_x, current_y = params[4], params[5]
-                else:
-                    current_x += params[4]
-                    current_y += params[5]
+    current_x, current_y = 0.0, 0.0
 
-                points.append((current_x, current_y))
-            i += 6
+    for command, args in zip(parts[1::2], parts[2::2]):
+        arity, endpoint = _COMMAND_PARAMS[command]
+        if arity == 0:  # Z не изменяет координаты
+            continue
 
-        elif current_command in ['S', 's']:  # Smooth cubic Bezier
-            # S имеет 4 параметра: x2 y2 x y
-            params = [float(tokens[i + j]) for j in range(4) if i + j < len(tokens)]
+        params = list(map(float, _NUMBER_RE.findall(args)))
+        relative = command.islower()
 
-            if len(params) >= 4:
-                if current_command == 'S':
-                    current_x, current_y = params[2], params[3]
+        if arity == 1:  # H, V - одна координата
+            horizontal = command in 'Hh'
+            for value in params:
+                if horizontal:
+                    current_x = current_x + value if relative else value
                 else:
-                    current_x += params[2]
-                    current_y += params[3]
+                    current_y = current_y + value if relative else value
 
-                points.append((current_x, current_y))
-            i += 4
-
-        elif current_command in ['Q', 'q']:  # Quadratic Bezier
-            # Q имеет 4 параметра: x1 y1 x y
-            params = [float(tokens[i + j]) for j in range(4) if i + j < len(tokens)]
+                min_x = current_x if current_x < min_x else min_x
+                max_x = current_x if current_x > max_x else max_x
+                min_y = current_y if current_y < min_y else min_y
+                max_y = current_y if current_y > max_y else max_y
+            continue
 
-            if len(params) >= 4:
-                if current_command == 'Q':
-                    current_x, current_y = params[2], params[3]
-                else:
-                    current_x += params[2]
-                    current_y += params[3]
+        for j in range(endpoint, len(params) - arity + endpoint + 1, arity):
+            if relative:
+                current_x += params[j]
+                current_y += params[j + 1]
+            else:
+                current_x, current_y = params[j], params[j + 1]
 
-                points.append((current_x, current_y))
-            i += 4
+            min_x = current_x if current_x < min_x else min_x
+            max_x = current_x if current_x > max_x else max_x
+            min_y = current_y if current_y < min_y else min_y
+            max_y = current_y if current_y > max_y else max_y
 
-        elif current_command in ['T', 't']:  # Smooth quadratic Bezier
-            # T имеет 2 параметра: x y
-            params = [float(tokens[i + j]) for j in range(2) if i + j < len(tokens)]
+    return min_x, min_y, max_x, max_y
 
-            if len(params) >= 2:
-                if current_command == 'T':
-                    current_x, current_y = params[0], params[1]
-                else:
-                    current_x += params[0]
-                    current_y += params[1]
 
-                points.append((current_x, current_y))
-            i += 2
+@lru_cache(maxsize=4096)
+def get_path_bbox(d: str) -> Tuple[float, float, float, float]:
+    """
+    Вычисляет bounding box для SVG path
 
-        elif current_command in ['A', 'a']:  # Arc
-            # A имеет 7 параметров: rx ry x-axis-rotation large-arc-flag sweep-flag x y
-            params = [float(tokens[i + j]) for j in range(7) if i + j < len(tokens)]
+    Результат кэшируется по строке d: одинаковые слои разбираются один раз.
 
-            if len(params) >= 7:
-                if current_command == 'A':
-                    current_x, current_y = params[5], params[6]
-                else:
-                    current_x += params[5]
-                    current_y += params[6]
+    Args:
+        d: атрибут 'd' элемента path
 
-                points.append((current_x, current_y))
-            i += 7
+    Returns:
+        (min_x, min_y, max_x, max_y)
+    """
+    # Path без единой цифры (пустой, только пробелы или "Z") не содержит координат
+    if not _DIGIT_RE.search(d):
+        return (0, 0, 0, 0)
 
-        elif current_command in ['Z', 'z']:  # Close path
-            # Не изменяет координаты
-            i += 1
+    min_x, min_y, max_x, max_y = _bbox_scan(d)
 
-        else:
-            # Неизвестная команда, пропускаем
-            i += 1
+    if min_x == math.inf:
+        return (0, 0, 0, 0)
 
-    return points
+    return (float(min_x), float(min_y), float(max_x), float(max_y))
 
 
-def get_path_bbox(d: str) -> Tuple[float, float, float, float]:
+def iter_path_bboxes(d_list: List[str]) -> Iterator[Tuple[float, float, float, float]]:
     """
-    Вычисляет bounding box для SVG path
+    Вычисляет bounding box каждого path, сохраняя порядок
+
+    Пути независимы друг от друга, поэтому для больших файлов расчёт
+    распределяется по процессам; на маленьких запуск пула дороже самой работы.
 
     Args:
-        d: атрибут 'd' элемента path
+        d_list: атрибуты 'd' элементов path
 
     Returns:
-        (min_x, min_y, max_x, max_y)
+        итератор (min_x, min_y, max_x, max_y) в порядке d_list
     """
-    points = parse_path_commands(d)
-
-    if not points:
-        return (0, 0, 0, 0)
-
-    xs = [p[0] for p in points]
-    ys = [p[1] for p in points]
+    if (os.cpu_count() or 1) < 2 or sum(map(len, d_list)) < PARALLEL_MIN_CHARS:
+        yield from map(get_path_bbox, d_list)
+        return
 
-    return (min(xs), min(ys), max(xs), max(ys))
+    with ProcessPoolExecutor() as executor:
+        yield from executor.map(get_path_bbox, d_list, chunksize=256)
 
 
 def analyze_svg(svg_path: str):
     """
     Анализирует распределение слоёв в SVG файле
     """
-    tree = ET.parse(svg_path)
-    root = tree.getroot()
+    # Потоковый разбор: нужны только атрибуты корня и 'd' каждого path,
+    # поэтому обработанные элементы сразу очищаются и DOM не накапливается
+    root = None
+    num_paths = 0
+    d_list = []
+
+    for event, elem in ET.iterparse(svg_path, events=('start', 'end'), **_ITERPARSE_OPTIONS):
+        if root is None:
+            root = elem
+            continue
 
-    svg_ns = '{http://www.w3.org/2000/svg}'
+        if event != 'end':
+            continue
+
+        if elem.tag == NS_PATH:
+            num_paths += 1
+            d = elem.get('d', '')
+            if d:
+                d_list.append(d)
+
+        if elem is not root:
+            elem.clear()
 
     # Получаем размеры документа
     width_str = root.get('width', '210mm')
     height_str = root.get('height', '297mm')
 
-    width_mm = float(width_str.replace('mm', '').strip())
-    height_mm = float(height_str.replace('mm', '').strip())
+    width_mm = parse_length_mm(width_str)
+    height_mm = parse_length_mm(height_str)
 
     print("=" * 70)
     print("АНАЛИЗ SVG ФАЙЛА")
@@ -221,38 +291,32 @@ def analyze_svg(svg_path: str):
     print(f"Размеры документа: {width_mm:.1f} x {height_mm:.1f} мм")
     print(f"ViewBox: {root.get('viewBox', 'не указан')}")
 
-    # Находим все path элементы
-    paths = root.findall(f'.//{svg_ns}path')
-    print(f"\nВсего слоёв (paths): {len(paths)}")
+    print(f"\nВсего слоёв (paths): {num_paths}")
 
-    if len(paths) == 0:
+    if num_paths == 0:
         print("Слои не найдены!")
         return
 
     # Анализируем bounding boxes всех слоёв
     print("\nАнализ границ слоёв...")
 
-    all_bboxes = []
+    # Для распределения по страницам нужны только min_y слоёв
+    min_ys = np.empty(len(d_list), dtype=np.float64)
     global_min_y = float('inf')
     global_max_y = float('-inf')
 
-    for i, path in enumerate(paths):
-        d = path.get('d', '')
-        if not d:
-            continue
+    for i, (min_x, min_y, max_x, max_y) in enumerate(iter_path_bboxes(d_list)):
+        min_ys[i] = min_y
 
-        bbox = get_path_bbox(d)
-        min_x, min_y, max_x, max_y = bbox
-
-        all_bboxes.append(bbox)
-
-        global_min_y = min(global_min_y, min_y)
-        global_max_y = max(global_max_y, max_y)
+        if min_y < global_min_y:
+            global_min_y = min_y
+        if max_y > global_max_y:
+            global_max_y = max_y
 
         if (i + 1) % 100 == 0:
-            print(f"  Обработано: {i + 1}/{len(paths)}")
+            print(f"  Обработано: {i + 1}/{num_paths}")
 
-    print(f"  Обработано: {len(paths)}/{len(paths)}")
+    print(f"  Обработано: {num_paths}/{num_paths}")
 
     # Вычисляем фактическую область контента
     content_height = global_max_y - global_min_y
@@ -269,8 +333,8 @@ def analyze_svg(svg_path: str):
 
     # Вычисляем сколько страниц A4 реально нужно
     A4_HEIGHT = 297.0
-    pages_by_document = int(height_mm / A4_HEIGHT) + (1 if height_mm % A4_HEIGHT > 0 else 0)
-    pages_by_content = int(content_height / A4_HEIGHT) + (1 if content_height % A4_HEIGHT > 0 else 0)
+    pages_by_document = math.ceil(height_mm / A4_HEIGHT)
+    pages_by_content = math.ceil(content_height / A4_HEIGHT)
 
     print(f"\nСтраниц A4:")
     print(f"  • По размеру документа: {pages_by_document}")
@@ -280,20 +344,12 @@ def analyze_svg(svg_path: str):
     # Распределение слоёв по высоте
     print(f"\nРаспределение слоёв по страницам A4 (от min_y={global_min_y:.1f}):")
 
-    layer_distribution = {}
-    for bbox in all_bboxes:
-        min_x, min_y, max_x, max_y = bbox
-        # Вычисляем относительно минимальной Y координаты
-        relative_y = min_y - global_min_y
-        page_num = int(relative_y / A4_HEIGHT)
-
-        if page_num not in layer_distribution:
-            layer_distribution[page_num] = 0
-        layer_distribution[page_num] += 1
+    # Номера страниц всех слоёв относительно минимальной Y координаты
+    page_nums = ((min_ys - global_min_y) / A4_HEIGHT).astype(np.intp)
+    layer_distribution = np.bincount(page_nums)
 
-    for page in sorted(layer_distribution.keys()):
-        count = layer_distribution[page]
-        print(f"  • Страница {page + 1}: {count} слоёв")
+    for page in np.flatnonzero(layer_distribution):
+        print(f"  • Страница {page + 1}: {layer_distribution[page]} слоёв")
 
     print("=" * 70)
 
@@ -6,35 +6,36 @@
 
 import sys
 import io
+import re
 from pathlib import Path
-from PyPDF2 import PdfReader
+import pypdfium2 as pdfium
 
 # Fix console encoding for Windows
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+_DIGIT_RE = re.compile(r'\d+')
+
 def debug_pdf(pdf_path: Path):
     """Выводит детальную информацию о PDF"""
-    reader = PdfReader(pdf_path)
+    pdf = pdfium.PdfDocument(pdf_path)
 
     print(f"Файл: {pdf_path}")
-    print(f"Всего страниц: {len(reader.pages)}")
+    print(f"Всего страниц: {len(pdf)}")
     print()
 
-    for page_num, page in enumerate(reader.pages, 1):
+    for page_num, page in enumerate(pdf, 1):
         print(f"=== Страница {page_num} ===")
 
         # Размеры
-        mediabox = page.mediabox
-        print(f"Размер: {float(mediabox.width):.1f} x {float(mediabox.height):.1f} points")
+        width, height = page.get_size()
+        print(f"Размер: {width:.1f} x {height:.1f} points")
 
         # Извлекаем текст (номера слоев)
         try:
-            text = page.extract_text()
+            text = page.get_textpage().get_text_range()
             # Извлекаем все числа из текста
-            import re
-            numbers = re.findall(r'\d+', text)
-            numbers = [int(n) for n in numbers if n.isdigit()]
+            numbers = list(map(int, _DIGIT_RE.findall(text)))
 
             if numbers:
                 print(f"Найдено номеров слоев: {len(numbers)}")
@@ -49,10 +50,10 @@ def debug_pdf(pdf_path: Path):
         print()
 
         # Для A4 PDF показываем только первые 3 и последние 3 страницы
-        if len(reader.pages) > 10 and page_num == 4:
-            print(f"... (пропущено {len(reader.pages) - 6} страниц) ...\n")
+        if len(pdf) > 10 and page_num == 4:
+            print(f"... (пропущено {len(pdf) - 6} страниц) ...\n")
             # Перепрыгиваем к последним страницам
-            for skip_page_num in range(page_num + 1, len(reader.pages) - 2):
+            for skip_page_num in range(page_num + 1, len(pdf) - 2):
                 pass
             continue
 
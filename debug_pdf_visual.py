@@ -7,13 +7,18 @@
 import sys
 import io
 from pathlib import Path
-from PyPDF2 import PdfReader
+import numpy as np
+import pypdfium2 as pdfium
 import re
 
 # Fix console encoding for Windows
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+_LAYER_NUMBER_RE = re.compile(r'\b\d+\b')
+# Длиннее 18 цифр число не помещается в int64 (и номером слоя не бывает)
+_MAX_NUMBER_DIGITS = 18
+
 def extract_visible_layers(page, page_height):
     """
     Анализирует графическое содержимое страницы и определяет видимые слои
@@ -27,41 +32,42 @@ def extract_visible_layers(page, page_height):
     """
     try:
         # Извлекаем текст с позиционной информацией
-        text = page.extract_text()
+        text = page.get_textpage().get_text_range()
 
-        # Извлекаем все числа
-        numbers = re.findall(r'\b\d+\b', text)
-        numbers = [int(n) for n in numbers if n.isdigit() and int(n) > 0 and int(n) <= 1000]
+        # Извлекаем все числа и оставляем правдоподобные номера слоёв
+        numbers = np.fromiter(
+            (int(n) for n in _LAYER_NUMBER_RE.findall(text) if len(n) <= _MAX_NUMBER_DIGITS),
+            dtype=np.int64,
+        )
+        numbers = numbers[(numbers > 0) & (numbers <= 1000)]
 
         # Удаляем дубликаты и сортируем
-        unique_numbers = sorted(set(numbers))
-
-        return unique_numbers
+        return np.unique(numbers).tolist()
     except Exception as e:
         print(f"Ошибка извлечения: {e}")
         return []
 
 def debug_pdf_visual(pdf_path: Path, max_pages_to_show=5):
     """Анализирует видимое содержимое PDF страниц"""
-    reader = PdfReader(pdf_path)
+    pdf = pdfium.PdfDocument(pdf_path)
+    # Страницы загружаются по индексу, только те, что показываются
+    num_pages = len(pdf)
 
     print(f"Файл: {pdf_path}")
-    print(f"Всего страниц: {len(reader.pages)}")
+    print(f"Всего страниц: {num_pages}")
     print()
 
     all_visible_layers = []
 
-    pages_to_analyze = min(max_pages_to_show, len(reader.pages))
+    pages_to_analyze = min(max_pages_to_show, num_pages)
 
     for page_num in range(pages_to_analyze):
-        page = reader.pages[page_num]
+        page = pdf[page_num]
 
         print(f"=== Страница {page_num + 1} ===")
 
         # Размеры
-        mediabox = page.mediabox
-        page_width = float(mediabox.width)
-        page_height = float(mediabox.height)
+        page_width, page_height = page.get_size()
         print(f"Размер: {page_width:.1f} x {page_height:.1f} points")
 
         # Извлекаем видимые слои
@@ -82,15 +88,13 @@ def debug_pdf_visual(pdf_path: Path, max_pages_to_show=5):
         print()
 
     # Показываем последнюю страницу если страниц больше max_pages_to_show
-    if len(reader.pages) > max_pages_to_show:
-        print(f"... (пропущено {len(reader.pages) - max_pages_to_show - 1} страниц) ...\n")
+    if num_pages > max_pages_to_show:
+        print(f"... (пропущено {num_pages - max_pages_to_show - 1} страниц) ...\n")
 
-        page = reader.pages[-1]
-        print(f"=== Страница {len(reader.pages)} (последняя) ===")
+        page = pdf[num_pages - 1]
+        print(f"=== Страница {num_pages} (последняя) ===")
 
-        mediabox = page.mediabox
-        page_width = float(mediabox.width)
-        page_height = float(mediabox.height)
+        page_width, page_height = page.get_size()
         print(f"Размер: {page_width:.1f} x {page_height:.1f} points")
 
         visible_layers = extract_visible_layers(page, page_height)
@@ -15,26 +15,76 @@
     python match_and_number_layers.py simplified.svg optimized.svg
 """
 
-import xml.etree.ElementTree as ET
+import os
 import sys
 import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 import re
-import math
+from xml.sax.saxutils import escape
 
+import numpy as np
 
-def parse_svg_path_to_points(path_d: str) -> List[Tuple[float, float]]:
+from svg_common import NS_PATH, TEXT_TEMPLATE, find_path_elements
+
+# lxml (libxml2) разбирает большие SVG в разы быстрее ElementTree
+try:
+    from lxml import etree as ET
+
+    # Снимаем ограничение libxml2 на размер узла: атрибут 'd' бывает огромным
+    _PARSE_OPTIONS = {"huge_tree": True}
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+    _PARSE_OPTIONS = {}
+
+try:
+    from scipy.optimize import linear_sum_assignment
+
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Заглушка декоратора: без numba функция остаётся обычной Python функцией"""
+        return lambda func: func
+
+# Токены SVG path: буква команды или число; пробелы и запятые пропускаются
+_PATH_TOKEN_RE = re.compile(
+    r"[MLHVZCSQTAmlhvzcsqta]|[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?"
+)
+
+# Разбиение path на команды и числа для numba-ядра
+_COMMAND_SPLIT_RE = re.compile(r"([MLHVZCSQTAmlhvzcsqta])")
+_NUMBER_RE = re.compile(r"[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?")
+
+# С какого суммарного размера двух файлов сигнатуры считаются в двух процессах
+PARALLEL_MIN_BYTES = 5_000_000
+
+# Веса компонент сигнатуры: длина пути, количество точек, площадь, соотношение сторон
+SIGNATURE_WEIGHTS = np.array([1.0, 0.1, 0.5, 10.0])
+
+
+def parse_svg_path_to_points(path_d: str) -> np.ndarray:
     """
-    Парсит SVG path в список координат (x, y).
+    Парсит SVG path в массив координат (x, y) формы (N, 2).
     Упрощённая версия: обрабатывает M, L команды.
     """
-    points = []
+    # Плоский буфер float64 (x0, y0, x1, y1, ...) вместо списка кортежей:
+    # 16 байт на точку, и массив NumPy строится поверх него без копии
+    coords = array("d")
 
-    # Упрощённый парсинг: заменяем команды на разделители
-    path_d = path_d.replace(",", " ")
-    path_d = re.sub(r"([MLHVZmlhvz])", r" \1 ", path_d)
-    tokens = path_d.split()
+    # Один проход скомпилированного регулярного выражения вместо replace + sub + split
+    tokens = _PATH_TOKEN_RE.findall(path_d)
 
     i = 0
     current_x, current_y = 0.0, 0.0
@@ -47,7 +97,7 @@ def parse_svg_path_to_points(path_d: str) -> List[Tuple[float, float]]:
                 try:
                     x = float(tokens[i + 1])
                     y = float(tokens[i + 2])
-                    points.append((x, y))
+                    coords.extend((x, y))
                     current_x, current_y = x, y
                     i += 3
                 except ValueError:
@@ -62,7 +112,7 @@ def parse_svg_path_to_points(path_d: str) -> List[Tuple[float, float]]:
                     dy = float(tokens[i + 2])
                     current_x += dx
                     current_y += dy
-                    points.append((current_x, current_y))
+                    coords.extend((current_x, current_y))
                     i += 3
                 except ValueError:
                     i += 1
@@ -73,7 +123,7 @@ def parse_svg_path_to_points(path_d: str) -> List[Tuple[float, float]]:
             if i + 1 < len(tokens):
                 try:
                     current_x = float(tokens[i + 1])
-                    points.append((current_x, current_y))
+                    coords.extend((current_x, current_y))
                     i += 2
                 except ValueError:
                     i += 1
@@ -84,7 +134,7 @@ def parse_svg_path_to_points(path_d: str) -> List[Tuple[float, float]]:
             if i + 1 < len(tokens):
                 try:
                     current_y = float(tokens[i + 1])
-                    points.append((current_x, current_y))
+                    coords.extend((current_x, current_y))
                     i += 2
                 except ValueError:
                     i += 1
@@ -94,257 +144,471 @@ def parse_svg_path_to_points(path_d: str) -> List[Tuple[float, float]]:
         else:
             i += 1
 
-    return points
+    return np.frombuffer(coords, dtype=np.float64).reshape(-1, 2)
 
 
-def normalize_points(points: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
-    """
-    Нормализует точки: смещает к (0,0) и поворачивает к базовой ориентации.
-    """
-    if not points:
-        return []
-
-    # Находим центр масс
-    cx = sum(p[0] for p in points) / len(points)
-    cy = sum(p[1] for p in points) / len(points)
-
-    # Смещаем к (0, 0)
-    translated = [(x - cx, y - cy) for x, y in points]
-
-    return translated
-
-
-def compute_path_signature(
-    points: List[Tuple[float, float]], num_samples: int = 50
-) -> Tuple:
+def compute_path_signature(points: np.ndarray, num_samples: int = 50) -> Tuple:
     """
     Вычисляет "отпечаток" пути для сравнения.
     Возвращает кортеж характеристик, инвариантных к смещению и вращению.
     """
-    if not points or len(points) < 2:
+    if len(points) < 2:
         return (0, 0, 0, 0)
 
+    x, y = points[:, 0], points[:, 1]
+
     # 1. Общая длина пути
-    total_length = 0.0
-    for i in range(len(points) - 1):
-        dx = points[i + 1][0] - points[i][0]
-        dy = points[i + 1][1] - points[i][1]
-        total_length += math.sqrt(dx * dx + dy * dy)
+    segments = np.diff(points, axis=0)
+    total_length = float(np.hypot(segments[:, 0], segments[:, 1]).sum())
 
     # 2. Количество точек
     num_points = len(points)
 
-    # 3. Площадь (приближённая через shoelace formula)
-    area = 0.0
-    for i in range(len(points) - 1):
-        area += points[i][0] * points[i + 1][1]
-        area -= points[i + 1][0] * points[i][1]
-    area = abs(area) / 2.0
+    # 3. Площадь (приближённая через shoelace formula).
+    # У незамкнутой ломаной shoelace-сумма зависит от положения, поэтому
+    # она переносится к центру масс аналитически, без копии сдвинутых точек
+    cx, cy = x.mean(), y.mean()
+    raw_area = float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+    area = 0.5 * abs(raw_area - cx * (y[-1] - y[0]) + cy * (x[-1] - x[0]))
 
     # 4. Bounding box соотношение сторон
-    xs = [p[0] for p in points]
-    ys = [p[1] for p in points]
-    width = max(xs) - min(xs)
-    height = max(ys) - min(ys)
+    width, height = (points.max(axis=0) - points.min(axis=0)).tolist()
     aspect_ratio = width / height if height > 0.1 else 0
 
     # Округляем для устойчивости к мелким изменениям
     return (round(total_length, 1), num_points, round(area, 1), round(aspect_ratio, 2))
 
 
-def find_best_match(target_sig: Tuple, candidates: List[Tuple[int, Tuple]]) -> int:
+def _tokenize_path(path_d: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Разбивает SVG path на массивы для numba-ядра.
+
+    Returns:
+        (коды команд uint8, смещения аргументов каждой команды в nums, все числа float64)
+    """
+    parts = _COMMAND_SPLIT_RE.split(path_d)
+    runs = [_NUMBER_RE.findall(args) for args in parts[2::2]]
+
+    cmds = np.frombuffer("".join(parts[1::2]).encode("ascii"), dtype=np.uint8)
+    offsets = np.zeros(len(runs) + 1, dtype=np.int64)
+    np.cumsum([len(run) for run in runs], out=offsets[1:])
+    nums = np.array([num for run in runs for num in run], dtype=np.float64)
+
+    return cmds, offsets, nums
+
+
+@njit(cache=True)
+def _signature_kernel(cmds: np.ndarray, offsets: np.ndarray, nums: np.ndarray) -> Tuple:
+    """
+    Разбор path и все компоненты сигнатуры за один проход, без списка точек.
+
+    Разбор повторяет parse_svg_path_to_points: каждая команда M, L, m, l, H, V
+    даёт одну точку из первых своих аргументов, остальные команды пропускаются.
+    Площадь считается по исходным координатам и затем переносится к центру
+    масс аналитически, как в compute_path_signature.
+
+    Returns:
+        (длина, число точек, площадь, ширина, высота, первая x, первая y)
+    """
+    n = 0
+    current_x, current_y = 0.0, 0.0
+    first_x, first_y = 0.0, 0.0
+    prev_x, prev_y = 0.0, 0.0
+    sum_x, sum_y = 0.0, 0.0
+    length, raw_area = 0.0, 0.0
+    min_x, min_y = np.inf, np.inf
+    max_x, max_y = -np.inf, -np.inf
+
+    for k in range(cmds.size):
+        cmd = cmds[k]
+        count = offsets[k + 1] - offsets[k]
+        start = offsets[k]
+
+        if cmd == 77 or cmd == 76:  # M, L
+            if count < 2:
+                continue
+            current_x, current_y = nums[start], nums[start + 1]
+        elif cmd == 109 or cmd == 108:  # m, l
+            if count < 2:
+                continue
+            current_x += nums[start]
+            current_y += nums[start + 1]
+        elif cmd == 72:  # H
+            if count < 1:
+                continue
+            current_x = nums[start]
+        elif cmd == 86:  # V
+            if count < 1:
+                continue
+            current_y = nums[start]
+        else:
+            continue
+
+        if n == 0:
+            first_x, first_y = current_x, current_y
+        else:
+            dx = current_x - prev_x
+            dy = current_y - prev_y
+            length += np.sqrt(dx * dx + dy * dy)
+            raw_area += prev_x * current_y - current_x * prev_y
+
+        sum_x += current_x
+        sum_y += current_y
+        min_x = min(min_x, current_x)
+        min_y = min(min_y, current_y)
+        max_x = max(max_x, current_x)
+        max_y = max(max_y, current_y)
+        prev_x, prev_y = current_x, current_y
+        n += 1
+
+    if n == 0:
+        return 0.0, 0, 0.0, 0.0, 0.0, 0.0, 0.0
+
+    # Перенос shoelace-суммы незамкнутой ломаной к центру масс
+    cx, cy = sum_x / n, sum_y / n
+    area = raw_area - cx * (prev_y - first_y) + cy * (prev_x - first_x)
+
+    return length, n, abs(area) / 2.0, max_x - min_x, max_y - min_y, first_x, first_y
+
+
+def compute_signature_from_d(path_d: str) -> Tuple[Tuple, Optional[Tuple[float, float]]]:
+    """
+    Вычисляет сигнатуру пути и его первую точку прямо из атрибута d.
+
+    С numba весь разбор и расчёт выполняются одним скомпилированным ядром,
+    без numba - через parse_svg_path_to_points и compute_path_signature.
+
+    Returns:
+        (сигнатура, первая точка пути или None для пустого пути)
+    """
+    if not NUMBA_AVAILABLE:
+        points = parse_svg_path_to_points(path_d)
+        signature = compute_path_signature(points)
+        first_point = tuple(points[0].tolist()) if len(points) else None
+        return signature, first_point
+
+    length, num_points, area, width, height, first_x, first_y = _signature_kernel(
+        *_tokenize_path(path_d)
+    )
+    first_point = (first_x, first_y) if num_points else None
+
+    if num_points < 2:
+        return (0, 0, 0, 0), first_point
+
+    aspect_ratio = width / height if height > 0.1 else 0
+
+    # Округление то же, что в compute_path_signature
+    signature = (round(length, 1), num_points, round(area, 1), round(aspect_ratio, 2))
+    return signature, first_point
+
+
+def find_best_match(
+    target_sig: Tuple, candidate_sigs: np.ndarray, used: Optional[np.ndarray] = None
+) -> int:
     """
     Находит наилучшее совпадение для target_sig среди candidates.
 
+    Взвешенное расстояние до всех кандидатов считается одной векторной
+    операцией; уже использованные кандидаты получают бесконечное расстояние.
+
     Args:
         target_sig: сигнатура искомого пути
-        candidates: список (index, signature) для сравнения
+        candidate_sigs: сигнатуры кандидатов, массив формы (N, 4)
+        used: булева маска уже использованных кандидатов (или None)
+
+    Returns:
+        позиция наилучшего кандидата в candidate_sigs (-1, если выбирать не из чего)
+    """
+    distances = np.abs(candidate_sigs - np.asarray(target_sig, dtype=np.float64)) @ SIGNATURE_WEIGHTS
+
+    if used is not None:
+        distances[used] = np.inf
+
+    if distances.size == 0:
+        return -1
+
+    best_pos = int(distances.argmin())
+    return best_pos if np.isfinite(distances[best_pos]) else -1
+
+
+def match_exact_signatures(
+    optimized_signatures: List[Tuple[int, Tuple]],
+    simplified_signatures: List[Tuple[int, Tuple]],
+) -> Tuple[Dict[int, int], List[Tuple[int, Tuple]], List[Tuple[int, Tuple]]]:
+    """
+    Сопоставляет слои с совпадающими (после округления) сигнатурами.
+
+    Упрощённые слои раскладываются по корзинам с ключом-сигнатурой, каждый
+    оптимизированный слой ищется в своей корзине за O(1). Расстояние между
+    сигнатурами - метрика, поэтому пара с нулевым расстоянием не ухудшает
+    оптимальное сопоставление: полный поиск нужен только для остатка.
 
     Returns:
-        index наилучшего совпадения
+        (словарь {optimized_index: simplified_index},
+         несопоставленные оптимизированные, несопоставленные упрощённые)
     """
-    best_idx = -1
-    best_distance = float("inf")
+    # В корзине индексы по убыванию: pop() отдаёт первый по порядку слой
+    buckets = {}
+    for idx, sig in reversed(simplified_signatures):
+        buckets.setdefault(sig, []).append(idx)
 
-    for idx, cand_sig in candidates:
-        # Вычисляем расстояние между сигнатурами
-        distance = 0.0
+    matches = {}
+    residual_optimized = []
+    for opt_idx, opt_sig in optimized_signatures:
+        bucket = buckets.get(opt_sig)
+        if bucket:
+            matches[opt_idx] = bucket.pop()
+        else:
+            residual_optimized.append((opt_idx, opt_sig))
 
-        # Длина пути (вес 1.0)
-        distance += abs(target_sig[0] - cand_sig[0])
+    used_simplified = set(matches.values())
+    residual_simplified = [
+        (idx, sig) for idx, sig in simplified_signatures if idx not in used_simplified
+    ]
 
-        # Количество точек (вес 0.1)
-        distance += abs(target_sig[1] - cand_sig[1]) * 0.1
+    return matches, residual_optimized, residual_simplified
 
-        # Площадь (вес 0.5)
-        distance += abs(target_sig[2] - cand_sig[2]) * 0.5
 
-        # Соотношение сторон (вес 10.0)
-        distance += abs(target_sig[3] - cand_sig[3]) * 10.0
+def match_signatures_greedy(
+    optimized_signatures: List[Tuple[int, Tuple]],
+    simplified_signatures: List[Tuple[int, Tuple]],
+) -> Dict[int, int]:
+    """
+    Жадное сопоставление: каждому оптимизированному слою по порядку
+    назначается ближайший ещё не использованный упрощённый слой.
+    Используется, если scipy не установлен.
 
-        if distance < best_distance:
-            best_distance = distance
-            best_idx = idx
+    Returns:
+        Словарь {optimized_index: simplified_index}
+    """
+    matches = {}  # {opt_idx: simp_idx}
 
-    return best_idx
+    # Сигнатуры кандидатов собираются в массив один раз,
+    # использованные слои исключаются маской
+    simp_indices = [idx for idx, _ in simplified_signatures]
+    simp_sigs = np.array(
+        [sig for _, sig in simplified_signatures], dtype=np.float64
+    ).reshape(-1, 4)
+    used = np.zeros(len(simp_indices), dtype=bool)
+
+    # Индексы слоёв идут с пропусками (точные совпадения уже сняты),
+    # поэтому прогресс считается по позиции в переданном списке
+    for done, (opt_idx, opt_sig) in enumerate(optimized_signatures, start=1):
+        best_pos = find_best_match(opt_sig, simp_sigs, used)
+        if best_pos >= 0:
+            matches[opt_idx] = simp_indices[best_pos]
+            used[best_pos] = True
+
+        if done % 50 == 0:
+            print(f"  Сопоставлено: {done}/{len(optimized_signatures)}")
+
+    return matches
 
 
-def match_layers(simplified_svg: Path, optimized_svg: Path) -> Dict[int, int]:
+def match_signatures_optimal(
+    optimized_signatures: List[Tuple[int, Tuple]],
+    simplified_signatures: List[Tuple[int, Tuple]],
+) -> Dict[int, int]:
     """
-    Сопоставляет слои между упрощённым и оптимизированным файлами.
+    Находит глобально оптимальное сопоставление сигнатур (венгерский алгоритм).
+
+    Стоимость пары - то же взвешенное расстояние, что и в find_best_match,
+    но матрица строится векторно по признакам, а назначение ищется
+    в scipy целиком, без жадного перебора.
 
     Returns:
         Словарь {optimized_index: simplified_index}
     """
-    print("Чтение файлов...")
+    opt = np.array([sig for _, sig in optimized_signatures], dtype=np.float64)
+    simp = np.array([sig for _, sig in simplified_signatures], dtype=np.float64)
 
-    # Читаем упрощённый файл
-    tree_simp = ET.parse(simplified_svg)
-    root_simp = tree_simp.getroot()
-    paths_simp = root_simp.findall(".//{http://www.w3.org/2000/svg}path")
+    # Матрицу стоимости копим по одному признаку в двух буферах (N, M),
+    # не создавая временный массив (N, M, 4)
+    cost = np.zeros((len(opt), len(simp)))
+    diff = np.empty_like(cost)
+    for k, weight in enumerate(SIGNATURE_WEIGHTS):
+        np.subtract.outer(opt[:, k], simp[:, k], out=diff)
+        np.abs(diff, out=diff)
+        diff *= weight
+        cost += diff
 
-    # Читаем оптимизированный файл
-    tree_opt = ET.parse(optimized_svg)
-    root_opt = tree_opt.getroot()
-    paths_opt = root_opt.findall(".//{http://www.w3.org/2000/svg}path")
+    rows, cols = linear_sum_assignment(cost)
 
-    print(f"Упрощённый файл: {len(paths_simp)} слоёв")
-    print(f"Оптимизированный файл: {len(paths_opt)} слоёв")
+    return {
+        optimized_signatures[row][0]: simplified_signatures[col][0]
+        for row, col in zip(rows, cols)
+    }
 
-    if len(paths_simp) != len(paths_opt):
-        print("⚠ ПРЕДУПРЕЖДЕНИЕ: Количество слоёв различается!")
 
-    print("\nВычисление сигнатур упрощённого файла...")
-    simplified_signatures = []
-    for i, path in enumerate(paths_simp):
-        d_attr = path.get("d", "")
-        points = parse_svg_path_to_points(d_attr)
-        normalized = normalize_points(points)
-        signature = compute_path_signature(normalized)
-        simplified_signatures.append((i, signature))
-
-        if (i + 1) % 50 == 0:
-            print(f"  Обработано: {i + 1}/{len(paths_simp)}")
-
-    print("\nВычисление сигнатур оптимизированного файла...")
-    optimized_signatures = []
-    for i, path in enumerate(paths_opt):
-        d_attr = path.get("d", "")
-        points = parse_svg_path_to_points(d_attr)
-        normalized = normalize_points(points)
-        signature = compute_path_signature(normalized)
-        optimized_signatures.append((i, signature))
-
-        if (i + 1) % 50 == 0:
-            print(f"  Обработано: {i + 1}/{len(paths_opt)}")
+def read_path_data(svg_path: Path) -> List[str]:
+    """
+    Потоково читает атрибуты 'd' всех path файла.
 
-    print("\nСопоставление слоёв...")
-    matches = {}  # {opt_idx: simp_idx}
-    used_simplified = set()
+    Элементы очищаются сразу после чтения, поэтому DOM целиком
+    в памяти не держится.
+    """
+    d_attrs = []
 
-    for opt_idx, opt_sig in optimized_signatures:
-        # Ищем среди ещё не использованных
-        available = [
-            (idx, sig)
-            for idx, sig in simplified_signatures
-            if idx not in used_simplified
-        ]
+    for _, elem in ET.iterparse(str(svg_path), events=("end",), **_PARSE_OPTIONS):
+        if elem.tag == NS_PATH:
+            d_attrs.append(elem.get("d", ""))
+        elem.clear()
 
-        if available:
-            best_match = find_best_match(opt_sig, available)
-            matches[opt_idx] = best_match
-            used_simplified.add(best_match)
+    return d_attrs
 
-        if (opt_idx + 1) % 50 == 0:
-            print(f"  Сопоставлено: {opt_idx + 1}/{len(paths_opt)}")
+
+def compute_all_sigs(
+    svg_path: Path,
+) -> Tuple[List[Tuple[int, Tuple]], Dict[int, Tuple[float, float]]]:
+    """
+    Вычисляет сигнатуры всех path файла.
+
+    Результаты кэшируются по строке d в пределах файла.
+
+    Returns:
+        (список (индекс, сигнатура),
+         словарь {индекс: первая точка пути} для непустых путей)
+    """
+    signatures = []
+    first_points = {}
+
+    # Одинаковые слои (повторяющиеся детали) разбираются один раз
+    cache = {}
+
+    for i, d_attr in enumerate(read_path_data(svg_path)):
+        cached = cache.get(d_attr)
+        if cached is None:
+            cached = cache[d_attr] = compute_signature_from_d(d_attr)
+
+        signature, first_point = cached
+        if first_point is not None:
+            first_points[i] = first_point
+        signatures.append((i, signature))
+
+    return signatures, first_points
+
+
+def match_layers(
+    simplified_svg: Path, optimized_svg: Path
+) -> Tuple[Dict[int, int], Dict[int, Tuple[float, float]], int]:
+    """
+    Сопоставляет слои между упрощённым и оптимизированным файлами.
+
+    Returns:
+        (словарь {optimized_index: simplified_index},
+         словарь {optimized_index: первая точка пути} для размещения номеров,
+         число path в оптимизированном файле)
+    """
+    print("Чтение файлов и вычисление сигнатур...")
+
+    # Файлы независимы: большие обрабатываем одновременно в двух процессах
+    total_bytes = simplified_svg.stat().st_size + optimized_svg.stat().st_size
+    if (os.cpu_count() or 1) >= 2 and total_bytes >= PARALLEL_MIN_BYTES:
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            simp_future = executor.submit(compute_all_sigs, simplified_svg)
+            opt_future = executor.submit(compute_all_sigs, optimized_svg)
+            simplified_signatures, _ = simp_future.result()
+            optimized_signatures, opt_first_points = opt_future.result()
+    else:
+        simplified_signatures, _ = compute_all_sigs(simplified_svg)
+        optimized_signatures, opt_first_points = compute_all_sigs(optimized_svg)
+
+    print(f"Упрощённый файл: {len(simplified_signatures)} слоёв")
+    print(f"Оптимизированный файл: {len(optimized_signatures)} слоёв")
+
+    if len(simplified_signatures) != len(optimized_signatures):
+        print("⚠ ПРЕДУПРЕЖДЕНИЕ: Количество слоёв различается!")
+
+    print("\nСопоставление слоёв...")
+    matches, residual_opt, residual_simp = match_exact_signatures(
+        optimized_signatures, simplified_signatures
+    )
+    print(f"  Точных совпадений сигнатур: {len(matches)}")
+
+    if SCIPY_AVAILABLE and residual_opt and residual_simp:
+        matches.update(match_signatures_optimal(residual_opt, residual_simp))
+    else:
+        matches.update(match_signatures_greedy(residual_opt, residual_simp))
 
     print(f"\n✓ Сопоставлено {len(matches)} слоёв")
 
     # Проверка качества сопоставления
-    if len(matches) < len(paths_opt) * 0.95:
+    if len(matches) < len(optimized_signatures) * 0.95:
         print(
-            f"⚠ ПРЕДУПРЕЖДЕНИЕ: Сопоставлено только {len(matches)}/{len(paths_opt)} слоёв"
+            f"⚠ ПРЕДУПРЕЖДЕНИЕ: Сопоставлено только {len(matches)}/{len(optimized_signatures)} слоёв"
         )
 
-    return matches
+    return matches, opt_first_points, len(optimized_signatures)
 
 
 def add_numbers_to_optimized_svg(
     optimized_svg: Path,
     output_svg: Path,
     matches: Dict[int, int],
+    first_points: Dict[int, Tuple[float, float]],
+    num_paths: int,
     font_size: float = 3.0,
     text_color: str = "red",
 ) -> int:
     """
     Добавляет номера на оптимизированный SVG согласно сопоставлению.
+
+    Координаты номеров берутся из first_points, посчитанных в match_layers,
+    поэтому пути повторно не разбираются. Дерево документа не строится:
+    готовые элементы <text> вставляются строками сразу после своих path,
+    остальное содержимое файла копируется байт в байт.
+
+    num_paths - число path, прочитанных парсером (read_path_data); если в
+    тексте файла их найдено другое количество, номера сдвинулись бы,
+    и вместо этого поднимается ValueError.
     """
     print("\nДобавление номеров на оптимизированный файл...")
 
-    # Регистрируем namespaces
-    namespaces = {"": "http://www.w3.org/2000/svg", "svg": "http://www.w3.org/2000/svg"}
-    for prefix, uri in namespaces.items():
-        ET.register_namespace(prefix, uri)
-
-    tree = ET.parse(optimized_svg)
-    root = tree.getroot()
+    fill = escape(text_color, {'"': "&quot;"})
+    data = optimized_svg.read_bytes()
 
-    svg_ns = "{http://www.w3.org/2000/svg}"
-    paths = root.findall(f".//{svg_ns}path")
+    # Индексы в matches и first_points идут в порядке path из read_path_data;
+    # find_path_elements должен найти те же элементы в том же порядке
+    path_elements = list(find_path_elements(data))
+    if len(path_elements) != num_paths:
+        raise ValueError(
+            f"Найдено path в тексте SVG: {len(path_elements)}, "
+            f"при разборе документа: {num_paths}; номера сдвинулись бы"
+        )
 
-    text_elements = []
+    chunks = []
+    last_end = 0
+    numbered = 0
 
-    for opt_idx, simp_idx in matches.items():
-        if opt_idx >= len(paths):
+    for path_idx, element in enumerate(path_elements):
+        simp_idx = matches.get(path_idx)
+        if simp_idx is None:
             continue
 
-        path = paths[opt_idx]
-        layer_number = simp_idx + 1  # Нумерация с 1
-
-        # Извлекаем начальные координаты
-        d_attr = path.get("d", "")
-        points = parse_svg_path_to_points(d_attr)
+        # Начальные координаты пути (или запасная позиция для пустого пути)
+        x_coord, y_coord = first_points.get(path_idx, (5.0, 10.0 + (path_idx * 15)))
+
+        text = TEXT_TEMPLATE.format(
+            prefix=element.group(1).decode("ascii"),
+            x=x_coord + 2,
+            y=y_coord - 1,
+            font_size=font_size,
+            fill=fill,
+            align="",
+            label=simp_idx + 1,  # Нумерация с 1
+        )
+        chunks.append(data[last_end : element.end()])
+        chunks.append(text.encode("utf-8"))
+        last_end = element.end()
+        numbered += 1
 
-        if points:
-            x_coord, y_coord = points[0]
-        else:
-            x_coord, y_coord = 5.0, 10.0 + (opt_idx * 15)
-
-        # Создаём текстовый элемент
-        text_elem = ET.Element(f"{svg_ns}text")
-        text_elem.set("x", str(x_coord + 2))
-        text_elem.set("y", str(y_coord - 1))
-        text_elem.set("font-size", f"{font_size}mm")
-        text_elem.set("font-family", "Arial, sans-serif")
-        text_elem.set("fill", text_color)
-        text_elem.set("font-weight", "bold")
-        text_elem.set("stroke", "none")
-        text_elem.text = str(layer_number)
-
-        text_elements.append((path, text_elem))
-
-    # Добавляем текстовые элементы в документ
-    for path, text_elem in text_elements:
-        parent = None
-        for elem in root.iter():
-            if path in list(elem):
-                parent = elem
-                break
-
-        if parent is not None:
-            try:
-                idx = list(parent).index(path)
-                parent.insert(idx + 1, text_elem)
-            except ValueError:
-                root.append(text_elem)
-        else:
-            root.append(text_elem)
+    chunks.append(data[last_end:])
 
     # Сохраняем
-    tree.write(output_svg, encoding="UTF-8", xml_declaration=True)
+    output_svg.write_bytes(b"".join(chunks))
     print(f"✓ Сохранён SVG с номерами: {output_svg.name}")
 
-    return len(matches)
+    return numbered
 
 
 def main():
@@ -399,13 +663,15 @@ def main():
     print("=" * 70)
 
     # Шаг 1: Сопоставление
-    matches = match_layers(simplified_path, optimized_path)
+    matches, opt_first_points, num_opt_paths = match_layers(simplified_path, optimized_path)
 
     # Шаг 2: Добавление номеров
     num_numbered = add_numbers_to_optimized_svg(
         optimized_path,
         output_svg,
         matches,
+        opt_first_points,
+        num_opt_paths,
         font_size=args.font_size,
         text_color=args.text_color,
     )
@@ -413,7 +679,7 @@ def main():
     print("\n" + "=" * 70)
     print("✓ ЗАВЕРШЕНО")
     print("=" * 70)
-    print(f"Сопоставлено слоёв: {num_numbered}")
+    print(f"Пронумеровано слоёв: {num_numbered}")
     print(f"Результат: {output_svg}")
     print("=" * 70)
 
@@ -8,24 +8,98 @@
 4. Разделяет PDF только на область с контентом (без пустых страниц)
 
 Требования:
-    pip install svglib PyPDF2 reportlab
+    pip install svglib pypdf reportlab
 
 Использование:
     python process_svg_to_a4_pdf_fixed.py input.svg [output_directory]
 """
 
-import xml.etree.ElementTree as ET
+import os
 import sys
 import io
 import argparse
+import hashlib
+import json
+import math
 import re
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Tuple, List
+from typing import Iterator, Tuple, List, Optional, Union
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from svg_common import (
+    NS_PATH,
+    TEXT_ALIGN_CENTER,
+    TEXT_TEMPLATE,
+    find_path_elements,
+    parse_length_mm,
+)
+
+# lxml (libxml2) разбирает большие SVG в разы быстрее ElementTree
+try:
+    from lxml import etree as ET
+
+    LXML_AVAILABLE = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+    LXML_AVAILABLE = False
+
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Заглушка декоратора: без numba функция остаётся обычной Python функцией"""
+        return lambda func: func
 
 # Fix console encoding for Windows
 if sys.platform == "win32":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
 
+_DIGIT_RE = re.compile(r"[0-9]")
+
+# Разбиение SVG path по буквам команд (буквы сохраняются в результате)
+# и числа внутри параметров одной команды
+_COMMAND_SPLIT_RE = re.compile(r"([MLHVCSQTAZmlhvcsqtaz])")
+_NUMBER_RE = re.compile(r"[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?")
+
+# Число параметров каждой команды и индекс конечной точки (x, y) среди них:
+# M/L/T x y, H x, V y, C x1 y1 x2 y2 x y, S/Q x1 y1 x y,
+# A rx ry rotation large-arc sweep x y, Z без параметров
+_COMMAND_PARAMS = {
+    command: params
+    for upper, params in {
+        "M": (2, 0), "L": (2, 0), "T": (2, 0), "H": (1, 0), "V": (1, 0),
+        "C": (6, 4), "S": (4, 2), "Q": (4, 2), "A": (7, 5), "Z": (0, 0),
+    }.items()
+    for command in (upper, upper.lower())
+}
+
+# С какого суммарного размера атрибутов 'd' bbox считается в пуле процессов
+PARALLEL_MIN_CHARS = 5_000_000
+
+# Слои меньше этого размера (мм) по обеим осям не нумеруются: шрифт для них
+# упирается в минимальный и на печати номер не читается. Bbox строится по
+# конечным точкам команд, поэтому path с кривыми и дугами нумеруются всегда
+MIN_LABELED_SIZE_MM = 0.5
+
+# Команды кривых и дуг в атрибуте 'd'
+_CURVE_COMMAND_RE = re.compile(r"[CSQTAcsqta]")
+
+# Кэш размеров документа и bbox слоёв между запусками, по хэшу содержимого SVG.
+# Версия формата меняется вместе с разбором path, чтобы старые записи не читались
+BOUNDS_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "svg_layer_processor"
+)
+_BOUNDS_CACHE_VERSION = 2
+
 
 def parse_svg_dimensions(svg_root) -> Tuple[float, float]:
     """
@@ -37,169 +111,274 @@ def parse_svg_dimensions(svg_root) -> Tuple[float, float]:
     width_str = svg_root.get("width", "210mm")
     height_str = svg_root.get("height", "297mm")
 
-    # Удаляем единицы измерения и конвертируем в float
-    width_mm = float(width_str.replace("mm", "").strip())
-    height_mm = float(height_str.replace("mm", "").strip())
+    width_mm = parse_length_mm(width_str)
+    height_mm = parse_length_mm(height_str)
 
     return width_mm, height_mm
 
 
-def parse_path_commands(d: str) -> List[Tuple[float, float]]:
+def _parse_numbers(params: str) -> List[float]:
+    """
+    Переводит параметры одной команды SVG path в список float
+
+    Обычно числа разделены пробелами или запятыми, и str.split намного
+    быстрее регулярного выражения; слитная запись вроде "1-2" или "1.5.5"
+    разбирается регулярным выражением.
+    """
+    try:
+        return list(map(float, params.replace(",", " ").split()))
+    except ValueError:
+        return list(map(float, _NUMBER_RE.findall(params)))
+
+
+def _path_bbox(d: str) -> Tuple[float, float, float, float]:
     """
-    Извлекает все координаты из SVG path
+    Вычисляет bounding box SVG path по сериям параметров команд
+
+    Параметры каждой команды (вместе с неявными повторами, как в
+    "M x,y x,y ...") переводятся в float одним вызовом map, а экстремумы
+    длинной серии берутся срезами и встроенными min/max. Для кривых и дуг
+    берётся только конечная точка; неполная группа параметров в конце
+    серии пропускается.
 
     Args:
         d: атрибут 'd' элемента path
 
     Returns:
-        список координат (x, y)
+        (min_x, min_y, max_x, max_y); (0, 0, 0, 0), если координат нет
     """
-    points = []
-
-    # Удаляем лишние пробелы и заменяем запятые на пробелы
-    d = d.replace(",", " ")
-    d = re.sub(r"\s+", " ", d)
+    # [текст до первой команды, команда, её параметры, команда, ...]
+    parts = _COMMAND_SPLIT_RE.split(d)
 
-    # Разбиваем на команды
-    tokens = re.findall(
-        r"[MLHVCSQTAZmlhvcsqtaz]|[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?", d
-    )
+    min_x = min_y = math.inf
+    max_x = max_y = -math.inf
 
-    i = 0
     current_x, current_y = 0.0, 0.0
-    current_command = None
-
-    while i < len(tokens):
-        token = tokens[i]
 
-        # Проверяем, является ли токен командой
-        if token in "MLHVCSQTAZmlhvcsqtaz":
-            current_command = token
-            i += 1
+    for command, params in zip(parts[1::2], parts[2::2]):
+        arity, endpoint = _COMMAND_PARAMS[command]
+        if arity == 0:  # Числа после Z пропускаем
             continue
 
-        # Обрабатываем координаты в зависимости от команды
-        if current_command in ["M", "m"]:  # Move to
-            x = float(token)
-            y = float(tokens[i + 1]) if i + 1 < len(tokens) else 0
-
-            if current_command == "M":  # Абсолютные координаты
-                current_x, current_y = x, y
-            else:  # Относительные координаты
-                current_x += x
-                current_y += y
-
-            points.append((current_x, current_y))
-            i += 2
-
-        elif current_command in ["L", "l"]:  # Line to
-            x = float(token)
-            y = float(tokens[i + 1]) if i + 1 < len(tokens) else 0
-
-            if current_command == "L":
-                current_x, current_y = x, y
-            else:
-                current_x += x
-                current_y += y
-
-            points.append((current_x, current_y))
-            i += 2
-
-        elif current_command in ["H", "h"]:  # Horizontal line
-            x = float(token)
-
-            if current_command == "H":
-                current_x = x
-            else:
-                current_x += x
-
-            points.append((current_x, current_y))
-            i += 1
+        values = _parse_numbers(params)
+        if not values:
+            continue
 
-        elif current_command in ["V", "v"]:  # Vertical line
-            y = float(token)
+        relative = command.islower()
 
-            if current_command == "V":
-                current_y = y
+        if arity == 1:  # H, V - одна координата, вторая не меняется
+            if command in "Hh":
+                xs, ys = values, None
             else:
-                current_y += y
-
-            points.append((current_x, current_y))
-            i += 1
-
-        elif current_command in ["C", "c"]:  # Cubic Bezier
-            params = [float(tokens[i + j]) for j in range(6) if i + j < len(tokens)]
-
-            if len(params) >= 6:
-                if current_command == "C":
-                    current_x, current_y = params[4], params[5]
+                xs, ys = None, values
+        else:
+            count = len(values)
+
+            # Одна группа параметров - самый частый случай, обходимся без срезов
+            if count == arity:
+                x = values[endpoint]
+                y = values[endpoint + 1]
+                if relative:
+                    current_x += x
+                    current_y += y
                 else:
-                    current_x += params[4]
-                    current_y += params[5]
-
-                points.append((current_x, current_y))
-            i += 6
+                    current_x, current_y = x, y
+
+                if current_x < min_x:
+                    min_x = current_x
+                if current_x > max_x:
+                    max_x = current_x
+                if current_y < min_y:
+                    min_y = current_y
+                if current_y > max_y:
+                    max_y = current_y
+                continue
+
+            end = count - count % arity
+            if end == 0:
+                continue
+            xs = values[endpoint:end:arity]
+            ys = values[endpoint + 1 : end : arity]
+
+        # Относительные координаты превращаем в абсолютные накопленной суммой
+        # (порядок сложений тот же, что при пошаговом обходе)
+        if xs is None:
+            xs = (current_x,)
+        elif relative:
+            xs = list(accumulate(xs, initial=current_x))[1:]
+        if ys is None:
+            ys = (current_y,)
+        elif relative:
+            ys = list(accumulate(ys, initial=current_y))[1:]
+
+        current_x = xs[-1]
+        current_y = ys[-1]
+
+        min_x = min(min_x, min(xs))
+        max_x = max(max_x, max(xs))
+        min_y = min(min_y, min(ys))
+        max_y = max(max_y, max(ys))
+
+    if min_x == math.inf:
+        return (0, 0, 0, 0)
 
-        elif current_command in ["S", "s"]:  # Smooth cubic Bezier
-            params = [float(tokens[i + j]) for j in range(4) if i + j < len(tokens)]
+    return (min_x, min_y, max_x, max_y)
 
-            if len(params) >= 4:
-                if current_command == "S":
-                    current_x, current_y = params[2], params[3]
-                else:
-                    current_x += params[2]
-                    current_y += params[3]
 
-                points.append((current_x, current_y))
-            i += 4
+@njit(cache=True)
+def _bbox_kernel(data: np.ndarray) -> Tuple:
+    """
+    Bounding box path прямо по байтам атрибута 'd' скомпилированным циклом
 
-        elif current_command in ["Q", "q"]:  # Quadratic Bezier
-            params = [float(tokens[i + j]) for j in range(4) if i + j < len(tokens)]
+    Числа разбираются по той же грамматике, что и _NUMBER_RE. Как и в
+    _path_bbox, каждая полная группа параметров даёт конечную точку,
+    неполная группа перед следующей командой пропускается.
 
-            if len(params) >= 4:
-                if current_command == "Q":
-                    current_x, current_y = params[2], params[3]
-                else:
-                    current_x += params[2]
-                    current_y += params[3]
+    Число переводится точно (с тем же округлением, что у float()), только
+    если мантисса меньше 2**53, а десятичный порядок не больше 22 по
+    модулю. На первом числе вне этих границ (например, repr float из 17 цифр)
+    ядро прекращает работу и сообщает об этом флагом.
 
-                points.append((current_x, current_y))
-            i += 4
+    Args:
+        data: байты атрибута 'd' (uint8)
 
-        elif current_command in ["T", "t"]:  # Smooth quadratic Bezier
-            params = [float(tokens[i + j]) for j in range(2) if i + j < len(tokens)]
+    Returns:
+        (exact, min_x, min_y, max_x, max_y); exact=False - bbox не посчитан;
+        бесконечности, если координат нет
+    """
+    n = data.size
+    current_x, current_y = 0.0, 0.0
+    min_x, min_y = np.inf, np.inf
+    max_x, max_y = -np.inf, -np.inf
 
-            if len(params) >= 2:
-                if current_command == "T":
-                    current_x, current_y = params[0], params[1]
-                else:
-                    current_x += params[0]
-                    current_y += params[1]
+    upper = 0
+    relative = False
+    arity = 0  # 0 - команды ещё не было или это Z: числа пропускаются
+    params = np.empty(7)
+    count = 0
 
-                points.append((current_x, current_y))
-            i += 2
+    i = 0
+    while i < n:
+        c = data[i]
+
+        # Буква команды: сброс бита строчной буквы ASCII даёт заглавную
+        if (65 <= c <= 90) or (97 <= c <= 122):
+            u = c & 0xDF
+            if u == 72 or u == 86:  # H, V
+                arity = 1
+            elif u == 77 or u == 76 or u == 84:  # M, L, T
+                arity = 2
+            elif u == 67:  # C
+                arity = 6
+            elif u == 83 or u == 81:  # S, Q
+                arity = 4
+            elif u == 65:  # A
+                arity = 7
+            elif u == 90:  # Z
+                arity = 0
+            else:  # Прочие буквы (например, одиночная 'e') - разделители
+                i += 1
+                continue
+            upper = u
+            relative = c != u
+            count = 0
+            i += 1
+            continue
 
-        elif current_command in ["A", "a"]:  # Arc
-            params = [float(tokens[i + j]) for j in range(7) if i + j < len(tokens)]
+        # Число: [-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?
+        j = i
+        negative = False
+        if c == 43 or c == 45:  # '+', '-'
+            negative = c == 45
+            j += 1
+
+        mantissa = 0.0
+        int_digits = 0
+        while j < n and 48 <= data[j] <= 57:
+            mantissa = mantissa * 10.0 + (data[j] - 48)
+            int_digits += 1
+            j += 1
+
+        frac_digits = 0
+        if j + 1 < n and data[j] == 46 and 48 <= data[j + 1] <= 57:  # '.'
+            j += 1
+            while j < n and 48 <= data[j] <= 57:
+                mantissa = mantissa * 10.0 + (data[j] - 48)
+                frac_digits += 1
+                j += 1
+
+        if int_digits == 0 and frac_digits == 0:
+            # Разделитель или знак без числа
+            i += 1
+            continue
 
-            if len(params) >= 7:
-                if current_command == "A":
-                    current_x, current_y = params[5], params[6]
-                else:
-                    current_x += params[5]
-                    current_y += params[6]
+        exponent = 0
+        if j < n and (data[j] == 101 or data[j] == 69):  # 'e', 'E'
+            k = j + 1
+            exp_negative = False
+            if k < n and (data[k] == 43 or data[k] == 45):
+                exp_negative = data[k] == 45
+                k += 1
+            if k < n and 48 <= data[k] <= 57:
+                while k < n and 48 <= data[k] <= 57:
+                    if exponent < 10000:
+                        exponent = exponent * 10 + (data[k] - 48)
+                    k += 1
+                if exp_negative:
+                    exponent = -exponent
+                j = k
+
+        i = j
+
+        # Точная мантисса, делённая или умноженная на точную степень
+        # десяти, округляется так же, как float()
+        exponent -= frac_digits
+        if mantissa >= 9007199254740992.0 or exponent > 22 or exponent < -22:
+            return False, min_x, min_y, max_x, max_y
+
+        if exponent >= 0:
+            value = mantissa * 10.0**exponent
+        else:
+            value = mantissa / 10.0 ** (-exponent)
+        if negative:
+            value = -value
 
-                points.append((current_x, current_y))
-            i += 7
+        if arity == 0:
+            continue
 
-        elif current_command in ["Z", "z"]:  # Close path
-            i += 1
+        params[count] = value
+        count += 1
+        if count < arity:
+            continue
+        count = 0
 
+        if upper == 72:  # Horizontal line: y не меняется
+            if relative:
+                current_x += params[0]
+            else:
+                current_x = params[0]
+        elif upper == 86:  # Vertical line: x не меняется
+            if relative:
+                current_y += params[0]
+            else:
+                current_y = params[0]
+        elif relative:
+            current_x += params[arity - 2]
+            current_y += params[arity - 1]
         else:
-            # Неизвестная команда, пропускаем
-            i += 1
+            current_x = params[arity - 2]
+            current_y = params[arity - 1]
 
-    return points
+        if current_x < min_x:
+            min_x = current_x
+        if current_x > max_x:
+            max_x = current_x
+        if current_y < min_y:
+            min_y = current_y
+        if current_y > max_y:
+            max_y = current_y
+
+    return True, min_x, min_y, max_x, max_y
 
 
 def get_path_bbox(d: str) -> Tuple[float, float, float, float]:
@@ -212,28 +391,34 @@ def get_path_bbox(d: str) -> Tuple[float, float, float, float]:
     Returns:
         (min_x, min_y, max_x, max_y)
     """
-    points = parse_path_commands(d)
-
-    if not points:
+    # Path без единой цифры (пустой, только пробелы или "Z") не содержит координат
+    if not _DIGIT_RE.search(d):
         return (0, 0, 0, 0)
 
-    xs = [p[0] for p in points]
-    ys = [p[1] for p in points]
+    if not NUMBA_AVAILABLE:
+        return _path_bbox(d)
 
-    return (min(xs), min(ys), max(xs), max(ys))
+    data = np.frombuffer(d.encode("utf-8"), dtype=np.uint8)
+    exact, min_x, min_y, max_x, max_y = _bbox_kernel(data)
+    if not exact:
+        return _path_bbox(d)
+    if min_x == math.inf:
+        return (0, 0, 0, 0)
 
+    return (min_x, min_y, max_x, max_y)
 
-def get_path_center(d: str) -> Tuple[float, float]:
+
+def get_bbox_center(bbox: Tuple[float, float, float, float]) -> Tuple[float, float]:
     """
-    Вычисляет центр bounding box для SVG path
+    Вычисляет центр уже известного bounding box
 
     Args:
-        d: атрибут 'd' элемента path
+        bbox: (min_x, min_y, max_x, max_y)
 
     Returns:
         (center_x, center_y)
     """
-    min_x, min_y, max_x, max_y = get_path_bbox(d)
+    min_x, min_y, max_x, max_y = bbox
     center_x = (min_x + max_x) / 2
     center_y = (min_y + max_y) / 2
     return (center_x, center_y)
@@ -314,39 +499,159 @@ def calculate_optimal_font_size(
     return optimal_size
 
 
-def analyze_content_bounds(svg_root) -> Tuple[float, float, float, float]:
+def iter_path_bboxes(d_list: List[str]) -> Iterator[Tuple[float, float, float, float]]:
+    """
+    Вычисляет bounding box каждого path, сохраняя порядок
+
+    Пути независимы друг от друга, поэтому для больших файлов расчёт
+    распределяется по процессам; на маленьких запуск пула дороже самой работы.
+
+    Args:
+        d_list: атрибуты 'd' элементов path
+
+    Returns:
+        итератор (min_x, min_y, max_x, max_y) в порядке d_list
+    """
+    if (os.cpu_count() or 1) < 2 or sum(map(len, d_list)) < PARALLEL_MIN_CHARS:
+        yield from map(get_path_bbox, d_list)
+        return
+
+    with ProcessPoolExecutor() as executor:
+        yield from executor.map(get_path_bbox, d_list, chunksize=64)
+
+
+def read_svg_paths(svg_path: Path) -> Tuple[float, float, List[str]]:
+    """
+    Потоково читает размеры документа и атрибуты 'd' всех path
+
+    Элементы очищаются сразу после чтения, поэтому для анализа границ
+    DOM целиком в памяти не держится.
+
+    Args:
+        svg_path: путь к SVG файлу
+
+    Returns:
+        (width_mm, height_mm, список атрибутов 'd' в порядке документа)
+    """
+    parse_options = {"huge_tree": True} if LXML_AVAILABLE else {}
+    dimensions = None
+    d_attrs = []
+
+    for event, elem in ET.iterparse(str(svg_path), events=("start", "end"), **parse_options):
+        if event == "start":
+            # Атрибуты корневого элемента доступны уже в его событии start
+            if dimensions is None:
+                dimensions = parse_svg_dimensions(elem)
+            continue
+
+        if elem.tag == NS_PATH:
+            d_attrs.append(elem.get("d", ""))
+        elem.clear()
+
+    width_mm, height_mm = dimensions
+    return width_mm, height_mm, d_attrs
+
+
+def analyze_content_bounds(
+    d_attrs: List[str],
+) -> Tuple[float, float, float, List[Tuple[float, float, float, float]], List[bool]]:
     """
     Анализирует фактические границы всех слоёв в SVG
 
     Args:
-        svg_root: корневой элемент SVG дерева
+        d_attrs: атрибуты 'd' всех path документа
 
     Returns:
-        (min_y, max_y, content_height, num_layers)
+        (min_y, max_y, content_height, bbox каждого path в порядке d_attrs,
+         есть ли в path кривые или дуги - их bbox по конечным точкам занижен)
     """
-    svg_ns = "{http://www.w3.org/2000/svg}"
-    paths = svg_root.findall(f".//{svg_ns}path")
+    if len(d_attrs) == 0:
+        return (0, 0, 0, [], [])
 
-    if len(paths) == 0:
-        return (0, 0, 0, 0)
+    # Считаем bbox один раз для каждой уникальной строки 'd'
+    unique_d = [d for d in dict.fromkeys(d_attrs) if d]
+    bbox_by_d = dict(zip(unique_d, iter_path_bboxes(unique_d)))
+    bboxes = [bbox_by_d.get(d, (0, 0, 0, 0)) for d in d_attrs]
 
     global_min_y = float("inf")
     global_max_y = float("-inf")
 
-    for path in paths:
-        d = path.get("d", "")
+    for d, (min_x, min_y, max_x, max_y) in zip(d_attrs, bboxes):
         if not d:
             continue
 
-        bbox = get_path_bbox(d)
-        min_x, min_y, max_x, max_y = bbox
-
         global_min_y = min(global_min_y, min_y)
         global_max_y = max(global_max_y, max_y)
 
     content_height = global_max_y - global_min_y
+    curved = [_CURVE_COMMAND_RE.search(d) is not None for d in d_attrs]
 
-    return (global_min_y, global_max_y, content_height, len(paths))
+    return (global_min_y, global_max_y, content_height, bboxes, curved)
+
+
+def load_bounds_cache(cache_path: Path) -> Optional[dict]:
+    """
+    Читает сохранённые размеры документа и bbox слоёв
+
+    Args:
+        cache_path: файл кэша для хэша входного SVG
+
+    Returns:
+        словарь width_mm, height_mm, min_y, max_y, content_height, bboxes, curved
+        или None, если записи нет, она повреждена или другой версии
+    """
+    try:
+        cached = json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(cached, dict) or cached.get("version") != _BOUNDS_CACHE_VERSION:
+        return None
+
+    # Запись могла обрезаться или остаться от другой сборки: без нужных
+    # полей нужного типа она считается промахом кэша
+    try:
+        bounds = {
+            key: float(cached[key])
+            for key in ("width_mm", "height_mm", "min_y", "max_y", "content_height")
+        }
+        if not isinstance(cached["bboxes"], list):
+            return None
+        bounds["bboxes"] = [tuple(map(float, bbox)) for bbox in cached["bboxes"]]
+        bounds["curved"] = cached["curved"]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if any(len(bbox) != 4 for bbox in bounds["bboxes"]):
+        return None
+
+    curved = bounds["curved"]
+    if not isinstance(curved, list) or len(curved) != len(bounds["bboxes"]):
+        return None
+    if not all(isinstance(flag, bool) for flag in curved):
+        return None
+
+    return bounds
+
+
+def save_bounds_cache(cache_path: Path, **bounds) -> None:
+    """
+    Сохраняет размеры документа и bbox слоёв; ошибка записи не прерывает обработку
+
+    Args:
+        cache_path: файл кэша для хэша входного SVG
+        bounds: width_mm, height_mm, min_y, max_y, content_height, bboxes, curved
+    """
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Запись через временный файл: параллельный запуск не прочитает половину
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(
+            json.dumps({"version": _BOUNDS_CACHE_VERSION, **bounds}), encoding="utf-8"
+        )
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Предупреждение: не удалось сохранить кэш границ слоёв: {e}")
 
 
 def add_layer_numbers_to_svg(
@@ -354,6 +659,7 @@ def add_layer_numbers_to_svg(
     output_svg_path: Path,
     font_size: float = 3.0,
     text_color: str = "red",
+    cache_dir: Optional[Path] = None,
 ) -> Tuple[int, float, float]:
     """
     Добавляет текстовые номера в центре каждого слоя SVG
@@ -363,33 +669,52 @@ def add_layer_numbers_to_svg(
         output_svg_path: путь к выходному SVG файлу
         font_size: размер шрифта номеров в мм
         text_color: цвет текста номеров
+        cache_dir: директория кэша границ слоёв; None - без кэша
 
     Returns:
         (num_layers, content_min_y, content_height)
     """
-    # Регистрируем namespaces для корректной записи
-    namespaces = {
-        "": "http://www.w3.org/2000/svg",
-        "sodipodi": "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd",
-        "inkscape": "http://www.inkscape.org/namespaces/inkscape",
-        "svg": "http://www.w3.org/2000/svg",
-    }
-
-    for prefix, uri in namespaces.items():
-        ET.register_namespace(prefix, uri)
-
-    # Парсим SVG
-    tree = ET.parse(input_svg_path)
-    root = tree.getroot()
+    data = input_svg_path.read_bytes()
+
+    # Повторный запуск на том же файле берёт размеры и bbox из кэша
+    cache_path = None
+    cached = None
+    if cache_dir is not None:
+        cache_key = hashlib.blake2b(data, digest_size=16).hexdigest()
+        cache_path = cache_dir / f"{cache_key}.json"
+        cached = load_bounds_cache(cache_path)
+
+    if cached is not None:
+        print(f"Границы слоёв взяты из кэша: {cache_path}")
+        width_mm, height_mm = cached["width_mm"], cached["height_mm"]
+        min_y, max_y = cached["min_y"], cached["max_y"]
+        content_height, bboxes = cached["content_height"], cached["bboxes"]
+        curved = cached["curved"]
+    else:
+        # Размеры документа и пути читаем потоково, без построения дерева
+        width_mm, height_mm, d_attrs = read_svg_paths(input_svg_path)
+
+        # Анализируем фактические границы контента; bbox каждого path
+        # нужен ещё и для номеров
+        print(f"Анализ границ слоёв...")
+        min_y, max_y, content_height, bboxes, curved = analyze_content_bounds(d_attrs)
+
+        if cache_path is not None:
+            save_bounds_cache(
+                cache_path,
+                width_mm=width_mm,
+                height_mm=height_mm,
+                min_y=min_y,
+                max_y=max_y,
+                content_height=content_height,
+                bboxes=bboxes,
+                curved=curved,
+            )
+
+    num_layers = len(bboxes)
 
-    # Получаем размеры документа
-    width_mm, height_mm = parse_svg_dimensions(root)
     print(f"Размеры SVG документа: {width_mm:.1f} x {height_mm:.1f} мм")
 
-    # Анализируем фактические границы контента
-    print(f"Анализ границ слоёв...")
-    min_y, max_y, content_height, num_layers = analyze_content_bounds(root)
-
     print(f"Найдено слоёв: {num_layers}")
     print(f"Фактическая область контента:")
     print(f"  • Y координаты: {min_y:.2f} - {max_y:.2f} мм")
@@ -399,83 +724,85 @@ def add_layer_numbers_to_svg(
 
     if num_layers == 0:
         print("Предупреждение: не найдено ни одного path элемента!")
-        tree.write(output_svg_path, encoding="UTF-8", xml_declaration=True)
+        output_svg_path.write_bytes(data)
         return (0, 0, 0)
 
-    # SVG namespace
-    svg_ns = "{http://www.w3.org/2000/svg}"
-
-    # Находим все path элементы (слои)
-    paths = root.findall(f".//{svg_ns}path")
+    # Дерево документа не строится: готовые элементы <text> вставляются
+    # строками сразу после своих path, остальное содержимое файла
+    # копируется байт в байт. Path в тексте идут в том же порядке, что и
+    # bbox из анализа границ
+    fill = escape(text_color, {'"': "&quot;"})
+    path_elements = list(find_path_elements(data))
+    if len(path_elements) != num_layers:
+        raise ValueError(
+            f"Найдено path в тексте SVG: {len(path_elements)}, "
+            f"при разборе документа: {num_layers}; номера сдвинулись бы"
+        )
 
-    # Для каждого слоя добавляем текстовый номер в центре
-    text_elements_to_add = []
+    chunks = []
+    last_end = 0
+    skipped = 0
 
     print(f"Добавление номеров в центре слоёв...")
 
-    for i, path in enumerate(paths):
+    for i, (element, bbox, is_curved) in enumerate(zip(path_elements, bboxes, curved)):
         layer_number = i + 1
 
-        # Извлекаем координаты центра слоя и bbox
-        d_attr = path.get("d", "")
-        center_x, center_y = get_path_center(d_attr)
-        bbox = get_path_bbox(d_attr)
-
-        # Вычисляем оптимальный размер шрифта для этого слоя
-        optimal_font_size = calculate_optimal_font_size(bbox, base_font_size=font_size)
-
-        # Создаём текстовый элемент с номером слоя
-        text_elem = ET.Element(f"{svg_ns}text")
-        text_elem.set("x", str(center_x))
-        text_elem.set("y", str(center_y))
-        text_elem.set("font-size", f"{optimal_font_size}mm")
-        # text_elem.set("font-size", "0.8em")
-        text_elem.set("font-family", "Arial, sans-serif")
-        text_elem.set("fill", text_color)
-        text_elem.set("font-weight", "bold")
-        text_elem.set("stroke", "none")
-        text_elem.set("text-anchor", "middle")  # Центрирование по горизонтали
-        text_elem.set("dominant-baseline", "middle")  # Центрирование по вертикали
-        text_elem.text = str(layer_number)
-
-        text_elements_to_add.append((path, text_elem))
+        if (
+            bbox[2] - bbox[0] < MIN_LABELED_SIZE_MM
+            and bbox[3] - bbox[1] < MIN_LABELED_SIZE_MM
+            and not is_curved
+        ):
+            # Слишком мелкий слой: номер не добавляем, нумерация остальных не сдвигается
+            skipped += 1
+        else:
+            # Центр слоя по bbox из анализа границ
+            center_x, center_y = get_bbox_center(bbox)
+
+            # Вычисляем оптимальный размер шрифта для этого слоя
+            optimal_font_size = calculate_optimal_font_size(bbox, base_font_size=font_size)
+
+            # Текстовый элемент с номером слоя; префикс пространства имён тот же, что у path
+            text = TEXT_TEMPLATE.format(
+                prefix=element.group(1).decode("ascii"),
+                x=center_x,
+                y=center_y,
+                font_size=optimal_font_size,
+                fill=fill,
+                align=TEXT_ALIGN_CENTER,
+                label=layer_number,
+            )
+            chunks.append(data[last_end : element.end()])
+            chunks.append(text.encode("utf-8"))
+            last_end = element.end()
 
         if (layer_number % 50 == 0) or (layer_number == num_layers):
             print(f"  Обработано слоёв: {layer_number}/{num_layers}")
 
-    # Добавляем текстовые элементы в документ
-    # Вставляем каждый текст сразу после соответствующего path
-    for path, text_elem in text_elements_to_add:
-        # Находим родительский элемент
-        parent = None
-        for elem in root.iter():
-            if path in list(elem):
-                parent = elem
-                break
-
-        if parent is not None:
-            try:
-                idx = list(parent).index(path)
-                parent.insert(idx + 1, text_elem)
-            except ValueError:
-                root.append(text_elem)
-        else:
-            root.append(text_elem)
+    if skipped:
+        print(f"  Без номера (меньше {MIN_LABELED_SIZE_MM} мм): {skipped}")
+
+    chunks.append(data[last_end:])
 
     # Сохраняем модифицированный SVG
-    tree.write(output_svg_path, encoding="UTF-8", xml_declaration=True)
+    output_svg_path.write_bytes(b"".join(chunks))
     print(f"✓ SVG с номерами сохранён: {output_svg_path.name}")
 
     return (int(num_layers), min_y, content_height)
 
 
-def convert_svg_to_pdf(svg_path: Path, pdf_path: Path):
+def convert_svg_to_pdf(svg_path: Path, pdf_path: Optional[Path] = None) -> bytes:
     """
     Конвертирует SVG в PDF используя svglib + reportlab
 
+    PDF собирается в памяти; на диск он пишется, только если указан pdf_path.
+
     Args:
         svg_path: путь к SVG файлу
-        pdf_path: путь к выходному PDF файлу
+        pdf_path: путь к выходному PDF файлу (None - не сохранять)
+
+    Returns:
+        Содержимое PDF
     """
     try:
         from svglib.svglib import svg2rlg
@@ -495,13 +822,58 @@ def convert_svg_to_pdf(svg_path: Path, pdf_path: Path):
         sys.exit(1)
 
     # Рендерим в PDF
-    renderPDF.drawToFile(drawing, str(pdf_path))
+    pdf_data = renderPDF.drawToString(drawing)
 
-    print(f"✓ PDF создан: {pdf_path.name}")
+    if pdf_path is not None:
+        pdf_path.write_bytes(pdf_data)
+        print(f"✓ PDF создан: {pdf_path.name}")
+    else:
+        print(f"✓ PDF создан в памяти ({len(pdf_data) / 1024:.0f} КБ)")
+
+    return pdf_data
+
+
+def _split_pages_pikepdf(pdf, y_offsets: List[float], page_width: float, page_height: float):
+    """
+    Заменяет единственную страницу pdf страницами A4 - её копиями с окном на свою полосу
+
+    Копии неглубокие: content stream и ресурсы у всех страниц общие,
+    каждая копия отличается только MediaBox/CropBox, вырезающим нужную
+    полосу исходной страницы. Содержимое не сдвигается и не копируется.
+
+    Args:
+        pdf: документ pikepdf с исходной длинной страницей
+        y_offsets: нижняя граница (в points) полосы для каждой страницы A4
+        page_width: ширина страницы A4 в points
+        page_height: высота страницы A4 в points
+    """
+    import pikepdf
+
+    original = pdf.pages[0]
+
+    # Прямой (не косвенный) словарь ресурсов копировался бы в каждую страницу
+    resources = original.obj.get("/Resources")
+    if resources is not None and not resources.is_indirect:
+        original.obj.Resources = pdf.make_indirect(resources)
+
+    num_pages = len(y_offsets)
+    for page_num, y_offset in enumerate(y_offsets):
+        pdf.pages.append(original)
+        page = pdf.pages[-1].obj
+
+        page_box = pikepdf.Array([0, y_offset, page_width, y_offset + page_height])
+        page.MediaBox = page_box
+        page.CropBox = page_box
+
+        if (page_num + 1) % 10 == 0 or (page_num + 1) == num_pages:
+            print(f"  Создано страниц: {page_num + 1}/{num_pages}")
+
+    # Исходная длинная страница больше не нужна, её содержимое осталось общим
+    del pdf.pages[0]
 
 
 def split_pdf_to_a4_pages(
-    input_pdf_path: Path,
+    input_pdf: Union[Path, bytes],
     output_pdf_path: Path,
     content_min_y: float,
     content_height: float,
@@ -509,18 +881,33 @@ def split_pdf_to_a4_pages(
     """
     Разделяет PDF на страницы A4, используя только область с контентом
 
+    Каждая страница A4 - копия исходной страницы с MediaBox/CropBox на свою
+    полосу; content stream у всех страниц общий. Используется pikepdf,
+    без него - pypdf (или PyPDF2).
+
     Args:
-        input_pdf_path: путь к входному PDF файлу
+        input_pdf: путь к входному PDF файлу или его содержимое
         output_pdf_path: путь к выходному PDF файлу с страницами A4
         content_min_y: минимальная Y координата контента в мм
         content_height: высота контента в мм
     """
     try:
-        from PyPDF2 import PdfReader, PdfWriter, Transformation, PageObject
+        import pikepdf
     except ImportError:
-        print("Ошибка: библиотека PyPDF2 не установлена")
-        print("Установите: pip install PyPDF2")
-        sys.exit(1)
+        pikepdf = None
+
+        # pypdf - поддерживаемый преемник PyPDF2 с тем же API, но быстрее
+        try:
+            from pypdf import PdfReader, PdfWriter
+            from pypdf.generic import RectangleObject
+        except ImportError:
+            try:
+                from PyPDF2 import PdfReader, PdfWriter
+                from PyPDF2.generic import RectangleObject
+            except ImportError:
+                print("Ошибка: библиотека pypdf не установлена")
+                print("Установите: pip install pypdf")
+                sys.exit(1)
 
     from reportlab.lib.units import mm
 
@@ -531,18 +918,30 @@ def split_pdf_to_a4_pages(
 
     print(f"Разделение PDF на страницы A4...")
 
-    reader = PdfReader(input_pdf_path)
+    if isinstance(input_pdf, bytes):
+        input_pdf = io.BytesIO(input_pdf)
+
+    if pikepdf is not None:
+        pdf = pikepdf.open(input_pdf)
+        pages = pdf.pages
+    else:
+        reader = PdfReader(input_pdf)
+        pages = reader.pages
 
-    if len(reader.pages) == 0:
+    if len(pages) == 0:
         print("Ошибка: входной PDF не содержит страниц")
         sys.exit(1)
 
-    original_page = reader.pages[0]
-
     # Получаем размеры оригинальной страницы
-    media_box = original_page.mediabox
-    original_width = float(media_box.width)
-    original_height = float(media_box.height)
+    if pikepdf is not None:
+        left, bottom, right, top = (float(value) for value in pages[0].mediabox)
+        original_width = right - left
+        original_height = top - bottom
+    else:
+        original_page = pages[0]
+        media_box = original_page.mediabox
+        original_width = float(media_box.width)
+        original_height = float(media_box.height)
 
     print(
         f"  Размер исходного PDF: {original_width:.1f} x {original_height:.1f} points"
@@ -559,57 +958,43 @@ def split_pdf_to_a4_pages(
     print(f"    • Высота: {content_height_points:.1f}")
 
     # Вычисляем количество страниц A4, необходимых для размещения контента
-    num_pages = int(content_height_points / A4_HEIGHT) + (
-        1 if content_height_points % A4_HEIGHT > 0 else 0
-    )
+    num_pages = math.ceil(content_height_points / A4_HEIGHT)
     print(f"  Потребуется страниц A4 для контента: {num_pages}")
 
-    writer = PdfWriter()
-
-    # Создаём страницы A4, извлекая соответствующие части контента
+    # Вычисляем вертикальное смещение для каждой страницы
     # ВАЖНО: В PDF координата Y=0 находится ВНИЗУ страницы
     # Поэтому мы начинаем с ВЕРХА контента и идем вниз
-    for page_num in range(num_pages):
-        # Создаём новую пустую страницу A4
-        new_page = PageObject.create_blank_page(width=A4_WIDTH, height=A4_HEIGHT)
-
-        # Вычисляем вертикальное смещение для текущей страницы
-        # Начинаем с ВЕРХА контента (максимальная Y координата) и идем вниз
-        # Каждая следующая страница показывает контент ниже предыдущей
-        # y_offset = content_max_y_points - ((page_num) * A4_HEIGHT)
-
-        # Вычисляем смещение в PDF-координатах (Y=0 снизу)
-        # Начинаем с самого верха оригинальной страницы
-        y_offset = original_height - (page_num + 1) * A4_HEIGHT
-        if y_offset < 0:
-            y_offset = 0
-
-        # # Начинаем с НИЗА контента и идем вверх
-        # # Используем обратный индекс: последняя страница показывает верх контента
-        # reverse_page_num = num_pages - 1 - page_num
-        # y_offset = content_min_y_points + (reverse_page_num * A4_HEIGHT)
-
-        # Создаём трансформацию: сдвигаем так, чтобы нужная часть оказалась внизу
-        transformation = Transformation().translate(0, -y_offset)
-
-        # Накладываем оригинальную страницу с трансформацией на пустую
-        # ВАЖНО: используем временную страницу-обертку для правильного применения трансформации
-        temp_wrapper = PageObject.create_blank_page(
-            width=original_width, height=original_height
-        )
-        temp_wrapper.merge_page(original_page)
-        temp_wrapper.add_transformation(transformation)
+    # Каждая следующая страница показывает контент ниже предыдущей
+    # y_offset = content_max_y_points - ((page_num) * A4_HEIGHT)
+
+    # Вычисляем смещение в PDF-координатах (Y=0 снизу)
+    # Начинаем с самого верха оригинальной страницы
+    y_offsets = [
+        max(original_height - (page_num + 1) * A4_HEIGHT, 0) for page_num in range(num_pages)
+    ]
+
+    # # Начинаем с НИЗА контента и идем вверх
+    # # Используем обратный индекс: последняя страница показывает верх контента
+    # reverse_page_num = num_pages - 1 - page_num
+    # y_offset = content_min_y_points + (reverse_page_num * A4_HEIGHT)
+
+    if pikepdf is not None:
+        _split_pages_pikepdf(pdf, y_offsets, A4_WIDTH, A4_HEIGHT)
+        pdf.save(output_pdf_path)
+        print(f"✓ PDF разделён на {num_pages} страниц A4: {output_pdf_path.name}")
+        return num_pages
 
-        # Теперь накладываем трансформированную обертку на нашу A4 страницу
-        new_page.merge_page(temp_wrapper)
+    writer = PdfWriter()
 
-        # Обрезаем страницу до размеров A4
-        new_page.mediabox.lower_left = [0, 0]
-        new_page.mediabox.upper_right = [A4_WIDTH, A4_HEIGHT]
-        new_page.cropbox.lower_left = [0, 0]
-        new_page.cropbox.upper_right = [A4_WIDTH, A4_HEIGHT]
+    for page_num, y_offset in enumerate(y_offsets):
+        # Добавляем оригинальную страницу ещё раз: writer копирует только её
+        # словарь, а content stream остаётся общим и записывается один раз
+        new_page = writer.add_page(original_page)
 
-        writer.add_page(new_page)
+        # Окно страницы - полоса A4 исходной страницы, содержимое не сдвигается
+        page_box = RectangleObject([0, y_offset, A4_WIDTH, y_offset + A4_HEIGHT])
+        new_page.mediabox = page_box
+        new_page.cropbox = page_box
 
         if (page_num + 1) % 10 == 0 or (page_num + 1) == num_pages:
             print(f"  Создано страниц: {page_num + 1}/{num_pages}")
@@ -639,10 +1024,10 @@ def main():
   • Разделяет только область с контентом (без пустых страниц)
   • Исправляет проблемы с обрезкой слоёв на границах страниц
 
-Скрипт создаст три файла:
+Скрипт создаст файлы:
   - input_numbered.svg (SVG с номерами слоёв)
-  - input_long.pdf (полный PDF одной длинной страницей)
   - input_A4.pdf (PDF разделённый на страницы A4)
+  - input_long.pdf (полный PDF одной длинной страницей, с --keep-intermediate)
         """,
     )
 
@@ -666,6 +1051,16 @@ def main():
         default="red",
         help="Цвет текста номеров (по умолчанию: red)",
     )
+    parser.add_argument(
+        "--keep-intermediate",
+        action="store_true",
+        help="Сохранить промежуточный PDF одной длинной страницей (input_long.pdf)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Не использовать кэш границ слоёв ({BOUNDS_CACHE_DIR})",
+    )
 
     args = parser.parse_args()
 
@@ -688,7 +1083,7 @@ def main():
     # Формируем имена выходных файлов
     base_name = input_path.stem
     numbered_svg = output_dir / f"{base_name}_numbered.svg"
-    long_pdf = output_dir / f"{base_name}_long.pdf"
+    long_pdf = output_dir / f"{base_name}_long.pdf" if args.keep_intermediate else None
     final_pdf = output_dir / f"{base_name}_A4.pdf"
 
     # Заголовок
@@ -707,17 +1102,20 @@ def main():
         numbered_svg,
         font_size=args.font_size,
         text_color=args.text_color,
+        cache_dir=None if args.no_cache else BOUNDS_CACHE_DIR,
     )
 
     # Шаг 2: Конвертируем в PDF
     print("\n[ШАГ 2/3] Конвертация в PDF...")
     print("-" * 70)
-    convert_svg_to_pdf(numbered_svg, long_pdf)
+    long_pdf_data = convert_svg_to_pdf(numbered_svg, long_pdf)
 
     # Шаг 3: Разделяем на страницы A4
     print("\n[ШАГ 3/3] Разделение на страницы A4...")
     print("-" * 70)
-    num_pages = split_pdf_to_a4_pages(long_pdf, final_pdf, content_min_y, content_height)
+    num_pages = split_pdf_to_a4_pages(
+        long_pdf_data, final_pdf, content_min_y, content_height
+    )
 
     # Итоги
     print("\n" + "=" * 70)
@@ -729,10 +1127,11 @@ def main():
     print(f"\nСозданные файлы:")
     print(f"  1. {numbered_svg.name}")
     print(f"     └─ SVG с пронумерованными слоями (номера в центре)")
-    print(f"  2. {long_pdf.name}")
-    print(f"     └─ Полный PDF одной длинной страницей")
-    print(f"  3. {final_pdf.name}")
+    print(f"  2. {final_pdf.name}")
     print(f"     └─ Финальный PDF, разделённый на страницы A4 (только контент)")
+    if long_pdf is not None:
+        print(f"  3. {long_pdf.name}")
+        print(f"     └─ Полный PDF одной длинной страницей")
     print("=" * 70)
 
     return 0
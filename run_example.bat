@@ -30,7 +30,7 @@ REM Обработка оригинального файла
 if exist "ladyghoststl-2-014.svg" (
     echo Обработка оригинального файла: ladyghoststl-2-014.svg
     echo ------------------------------------------
-    python process_svg_to_a4_pdf.py ladyghoststl-2-014.svg --output ./output_original
+    python process_svg_to_a4_pdf.py ladyghoststl-2-014.svg --output ./output_original --keep-intermediate
     echo.
 ) else (
     echo Файл ladyghoststl-2-014.svg не найден в текущей директории
@@ -41,7 +41,7 @@ REM Обработка оптимизированного файла
 if exist "nested2.svg" (
     echo Обработка оптимизированного файла: nested2.svg
     echo ------------------------------------------
-    python process_svg_to_a4_pdf.py nested2.svg --output ./output_nested
+    python process_svg_to_a4_pdf.py nested2.svg --output ./output_nested --keep-intermediate
     echo.
 ) else (
     echo Файл nested2.svg не найден в текущей директории
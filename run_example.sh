@@ -35,7 +35,7 @@ echo ""
 if [ -f "ladyghoststl-2-014.svg" ]; then
     echo "Обработка оригинального файла: ladyghoststl-2-014.svg"
     echo "------------------------------------------"
-    python3 process_svg_to_a4_pdf.py ladyghoststl-2-014.svg --output ./output_original
+    python3 process_svg_to_a4_pdf.py ladyghoststl-2-014.svg --output ./output_original --keep-intermediate
     echo ""
 else
     echo "Файл ladyghoststl-2-014.svg не найден в текущей директории"
@@ -46,7 +46,7 @@ fi
 if [ -f "nested2.svg" ]; then
     echo "Обработка оптимизированного файла: nested2.svg"
     echo "------------------------------------------"
-    python3 process_svg_to_a4_pdf.py nested2.svg --output ./output_nested
+    python3 process_svg_to_a4_pdf.py nested2.svg --output ./output_nested --keep-intermediate
     echo ""
 else
     echo "Файл nested2.svg не найден в текущей директории"
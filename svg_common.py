@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общие помощники для скриптов обработки SVG
+
+Разбор длин SVG, поиск элементов path в исходном тексте документа и
+разметка номеров слоёв, которые вставляются после них.
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterator, Pattern, Tuple
+
+# Теги SVG в нотации ElementTree/lxml ({namespace}tag)
+SVG_NS = "http://www.w3.org/2000/svg"
+NS_PATH = f"{{{SVG_NS}}}path"
+
+# Длина SVG: число и необязательная единица измерения (без единицы - мм)
+_LENGTH_RE = re.compile(r"\s*([-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*([a-z%]*)\s*")
+_UNIT_TO_MM = {"": 1.0, "mm": 1.0, "cm": 10.0, "in": 25.4, "pt": 25.4 / 72, "px": 25.4 / 96}
+
+# Объявления пространства имён SVG: xmlns="..." (без префикса) или xmlns:prefix="..."
+_SVG_NS_DECL_RE = re.compile(
+    rb"\sxmlns(?::([\w.-]+))?\s*=\s*([\"'])" + re.escape(SVG_NS.encode("ascii")) + rb"\2"
+)
+
+# Номер слоя: подставляются префикс, координаты, размер, цвет, выравнивание и номер
+TEXT_TEMPLATE = (
+    '<{prefix}text x="{x}" y="{y}" font-size="{font_size}mm" '
+    'font-family="Arial, sans-serif" fill="{fill}" font-weight="bold" '
+    'stroke="none"{align}>{label}</{prefix}text>'
+)
+
+# Центрирование текста по горизонтали и вертикали относительно (x, y)
+TEXT_ALIGN_CENTER = ' text-anchor="middle" dominant-baseline="middle"'
+
+
+def parse_length_mm(value: str) -> float:
+    """
+    Переводит длину SVG (например "210mm", "8.5in", "800px") в миллиметры
+
+    Args:
+        value: значение атрибута width/height
+
+    Returns:
+        длина в мм
+
+    Raises:
+        ValueError: значение не число или единица не переводится в мм ("100%", "12em")
+    """
+    match = _LENGTH_RE.fullmatch(value)
+    if match is None or match.group(2) not in _UNIT_TO_MM:
+        raise ValueError(f"Не удалось разобрать длину: '{value}'")
+
+    return float(match.group(1)) * _UNIT_TO_MM[match.group(2)]
+
+
+@lru_cache(maxsize=None)
+def _path_element_re(prefixes: Tuple[bytes, ...]) -> Pattern[bytes]:
+    """
+    Регулярное выражение для элементов path с одним из данных префиксов
+
+    Комментарии и CDATA захватываются отдельно, чтобы не принять их
+    содержимое за path; значения атрибутов могут содержать '>'. Имя тега
+    должно заканчиваться на 'path' (не <inkscape:path-effect>).
+    """
+    # Без объявленного пространства имён SVG path не ищутся вовсе
+    alternatives = b"|".join(re.escape(prefix) for prefix in prefixes) if prefixes else rb"(?!)"
+    return re.compile(
+        rb"<!--.*?-->|<!\[CDATA\[.*?\]\]>"
+        rb"|<(" + alternatives + rb")path(?=[\s/>])"
+        rb"(?:[^>\"']|\"[^\"]*\"|'[^']*')*?(?:/>|>.*?</\1path\s*>)",
+        re.DOTALL,
+    )
+
+
+def find_path_elements(data: bytes) -> Iterator["re.Match[bytes]"]:
+    """
+    Находит элементы SVG path в исходном тексте документа
+
+    Учитываются только префиксы, связанные с пространством имён SVG, поэтому
+    path идут в том же порядке и количестве, что и теги NS_PATH при разборе
+    документа парсером.
+
+    Args:
+        data: содержимое SVG файла
+
+    Returns:
+        Итератор совпадений; group(1) - префикс тега вместе с ':' (или b"")
+    """
+    prefixes = {
+        prefix + b":" if prefix else b"" for prefix, _ in _SVG_NS_DECL_RE.findall(data)
+    }
+
+    for element in _path_element_re(tuple(sorted(prefixes))).finditer(data):
+        if element.group(1) is not None:  # не комментарий и не CDATA
+            yield element